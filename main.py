@@ -3,12 +3,15 @@
 from __future__ import annotations
 
 import argparse
-import json
+from concurrent.futures import ThreadPoolExecutor
+import math
 import sys
 import time
 from pathlib import Path
 from typing import Any
 
+import orjson
+
 ROOT = Path(__file__).resolve().parent
 sys.path.insert(0, str(ROOT / "src"))
 
@@ -18,7 +21,7 @@ from tauto.storage import SqliteCandleStore  # noqa: E402
 
 
 def _pretty_print(data: Any) -> None:
-    print(json.dumps(data, ensure_ascii=False, indent=2))
+    print(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode())
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -79,7 +82,11 @@ def build_parser() -> argparse.ArgumentParser:
     candles_monitor_parser = subparsers.add_parser(
         "candles-monitor", help="Monitor candlestick storage for 1 minute"
     )
-    candles_monitor_parser.add_argument("inst_id", help="Instrument ID, e.g. BTC-USDT")
+    candles_monitor_parser.add_argument(
+        "inst_ids",
+        nargs="+",
+        help="Instrument IDs, e.g. BTC-USDT BTC-USDT-SWAP",
+    )
     candles_monitor_parser.add_argument("--bar", default="1s", help="Candlestick bar")
     candles_monitor_parser.add_argument(
         "--db", default="candles.db", help="SQLite DB path"
@@ -100,7 +107,7 @@ def build_parser() -> argparse.ArgumentParser:
         "--realtime-qps",
         type=float,
         default=1.0,
-        help="Realtime fetch QPS",
+        help="Realtime fetch QPS per instrument",
     )
 
     return parser
@@ -154,25 +161,37 @@ def main() -> None:
 
     if args.command == "candles-monitor":
         store = SqliteCandleStore(args.db)
-        service = CandlestickService(
-            client=client,
-            store=store,
-            bar=args.bar,
-            history_qps=args.history_qps,
-            realtime_qps=args.realtime_qps,
-        )
-        service.initialize()
-        start = time.monotonic()
-        for tick in range(args.duration):
-            service.fetch_realtime(args.inst_id)
-            latest = store.latest_timestamp(service.client.source, args.inst_id, args.bar)
-            now = time.strftime("%Y-%m-%d %H:%M:%S")
-            print(
-                f"[{now}] tick={tick + 1}/{args.duration} "
-                f"latest_ts={latest or 'n/a'}"
+        services = {
+            inst_id: CandlestickService(
+                client=client,
+                store=store,
+                bar=args.bar,
+                history_qps=args.history_qps,
+                realtime_qps=args.realtime_qps,
             )
-            next_tick = start + tick + 1
-            time.sleep(max(0.0, next_tick - time.monotonic()))
+            for inst_id in args.inst_ids
+        }
+        store.initialize()
+        start = time.monotonic()
+        tick = 0
+        with ThreadPoolExecutor(max_workers=len(services)) as executor:
+            while tick < args.duration:
+                futures = {
+                    inst_id: executor.submit(service.fetch_realtime, inst_id)
+                    for inst_id, service in services.items()
+                }
+                now = time.strftime("%Y-%m-%d %H:%M:%S")
+                for inst_id, future in futures.items():
+                    future.result()
+                    latest = store.latest_timestamp(client.source, inst_id, args.bar)
+                    print(
+                        f"[{now}] tick={tick + 1}/{args.duration} inst={inst_id} "
+                        f"latest_ts={latest or 'n/a'}"
+                    )
+                # Stay on the 1-second grid anchored at start; skip slots already missed.
+                tick = max(tick + 1, math.ceil(time.monotonic() - start))
+                if tick < args.duration:
+                    time.sleep(max(0.0, start + tick - time.monotonic()))
         return
 
 
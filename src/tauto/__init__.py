@@ -4,21 +4,27 @@ from .candles import CandlestickService, RateLimiter
 from .okx import OkxApiError, OkxClient, summarize_instruments
 from .storage import (
     CacheBackend,
+    CandleColumns,
     CandleStick,
     DatabaseBackend,
+    ShardedCandleStore,
     SqliteCandleStore,
     compute_retention_cutoff,
+    open_candle_store,
 )
 
 __all__ = [
     "CacheBackend",
+    "CandleColumns",
     "CandleStick",
     "CandlestickService",
     "DatabaseBackend",
     "OkxApiError",
     "OkxClient",
     "RateLimiter",
+    "ShardedCandleStore",
     "SqliteCandleStore",
     "compute_retention_cutoff",
+    "open_candle_store",
     "summarize_instruments",
 ]
@@ -2,18 +2,25 @@
 
 from __future__ import annotations
 
+from array import array
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional
 
+import orjson
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from .storage import CandleColumns
+
 
 class BinanceApiError(RuntimeError):
     """Raised when Binance API returns an error response."""
 
 
+BINANCE_KLINES_MAX_LIMIT = 1000
+
+
 @dataclass
 class BinanceClient:
     """Binance public REST API client (spot)."""
@@ -22,6 +29,8 @@ class BinanceClient:
     timeout: float = 10.0
     max_retries: int = 3
     retry_backoff: float = 0.5
+    pool_connections: int = 4
+    pool_maxsize: int = 16
     session: requests.Session = field(default_factory=requests.Session, init=False, repr=False)
 
     def __post_init__(self) -> None:
@@ -35,15 +44,24 @@ class BinanceClient:
             allowed_methods=("GET",),
             raise_on_status=False,
         )
-        adapter = HTTPAdapter(max_retries=retry)
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry,
+        )
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
 
+    def close(self) -> None:
+        """Close the keep-alive connections held by the session pool."""
+
+        self.session.close()
+
     def _request(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
         url = f"{self.base_url}{path}"
         response = self.session.get(url, params=params, timeout=self.timeout)
         response.raise_for_status()
-        payload = response.json()
+        payload = orjson.loads(response.content)
         if isinstance(payload, dict) and payload.get("code") is not None:
             raise BinanceApiError(f"Binance API error: {payload}")
         return payload
@@ -56,11 +74,11 @@ class BinanceClient:
         start_time: Optional[int] = None,
         end_time: Optional[int] = None,
     ) -> List[List[Any]]:
-        params: Dict[str, Any] = {"symbol": symbol, "interval": interval, "limit": str(limit)}
+        params: Dict[str, Any] = {"symbol": symbol, "interval": interval, "limit": limit}
         if start_time is not None:
-            params["startTime"] = str(start_time)
+            params["startTime"] = start_time
         if end_time is not None:
-            params["endTime"] = str(end_time)
+            params["endTime"] = end_time
         payload = self._request("/api/v3/klines", params)
         return payload if isinstance(payload, list) else []
 
@@ -69,8 +87,38 @@ class BinanceClient:
         return payload if isinstance(payload, dict) else {}
 
     def get_order_book(self, symbol: str, limit: int = 20) -> Dict[str, Any]:
-        payload = self._request("/api/v3/depth", {"symbol": symbol, "limit": str(limit)})
+        payload = self._request("/api/v3/depth", {"symbol": symbol, "limit": limit})
         return payload if isinstance(payload, dict) else {}
 
 
-__all__ = ["BinanceApiError", "BinanceClient"]
+def parse_kline_columns(inst_id: str, bar: str, rows: List[List[Any]]) -> CandleColumns:
+    """Parse a page of Binance klines column by column, without per-row objects."""
+
+    columns = list(zip(*rows))
+    # Binance reports the quote asset volume at index 7; older payloads may omit it.
+    if len(columns) > 7:
+        quote_volume = array("d", map(float, columns[7]))
+    else:
+        quote_volume = array("d", [0.0]) * len(rows)
+    return CandleColumns(
+        "binance",
+        inst_id,
+        bar,
+        ts=array("q", map(int, columns[0])),
+        open=array("d", map(float, columns[1])),
+        high=array("d", map(float, columns[2])),
+        low=array("d", map(float, columns[3])),
+        close=array("d", map(float, columns[4])),
+        volume=array("d", map(float, columns[5])),
+        volume_ccy=quote_volume,
+        volume_quote=array("d", quote_volume),
+        confirm=array("b", [1]) * len(rows),
+    )
+
+
+__all__ = [
+    "BINANCE_KLINES_MAX_LIMIT",
+    "BinanceApiError",
+    "BinanceClient",
+    "parse_kline_columns",
+]
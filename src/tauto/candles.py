@@ -2,37 +2,41 @@
 
 from __future__ import annotations
 
+from array import array
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta, timezone
+import threading
 import time
-from typing import Iterable, List, Optional
+from typing import Iterable, List, Optional, Sequence, Tuple
 
-from .okx import OkxClient
-from .storage import CandleStick, DatabaseBackend, compute_retention_cutoff
+from .okx import OKX_CANDLES_MAX_LIMIT, OKX_HISTORY_CANDLES_MAX_LIMIT, OkxClient
+from .storage import CandleColumns, CandleStick, DatabaseBackend, compute_retention_cutoff
 
 
 class RateLimiter:
-    """Simple token bucket rate limiter."""
+    """Token bucket rate limiter that sleeps at most once per acquire.
+
+    Safe to share between threads: slots are handed out under a lock and each
+    caller sleeps outside it until its own slot comes up.
+    """
 
     def __init__(self, rate_per_second: float) -> None:
         self._rate = max(rate_per_second, 0.0)
         self._capacity = max(rate_per_second, 1.0)
-        self._tokens = self._capacity
-        self._last_refill = time.monotonic()
+        self._interval = 1.0 / self._rate if self._rate > 0 else 0.0
+        self._next_time = time.monotonic() - (self._capacity - 1) * self._interval
+        self._lock = threading.Lock()
 
     def acquire(self) -> None:
         if self._rate <= 0:
             return
-        while True:
+        with self._lock:
             now = time.monotonic()
-            elapsed = now - self._last_refill
-            self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
-            self._last_refill = now
-            if self._tokens >= 1:
-                self._tokens -= 1
-                return
-            sleep_time = max((1 - self._tokens) / self._rate, 0.01)
-            time.sleep(sleep_time)
+            # Idle time earns burst credit, but never more than the bucket capacity.
+            scheduled = max(self._next_time, now - (self._capacity - 1) * self._interval)
+            self._next_time = scheduled + self._interval
+        wait = scheduled - now
+        if wait > 0:
+            time.sleep(wait)
 
 
 @dataclass
@@ -46,12 +50,16 @@ class CandlestickService:
     realtime_qps: float = 1.0
     retention_months: int = 1
     history_limit: int = 300
-    history_limiter: RateLimiter = field(init=False)
-    realtime_limiter: RateLimiter = field(init=False)
+    history_flush_size: int = 1500
+    history_limiter: Optional[RateLimiter] = None
+    realtime_limiter: Optional[RateLimiter] = None
 
     def __post_init__(self) -> None:
-        self.history_limiter = RateLimiter(self.history_qps)
-        self.realtime_limiter = RateLimiter(self.realtime_qps)
+        # Limiters may be shared between services that hit the same API budget.
+        if self.history_limiter is None:
+            self.history_limiter = RateLimiter(self.history_qps)
+        if self.realtime_limiter is None:
+            self.realtime_limiter = RateLimiter(self.realtime_qps)
 
     def initialize(self) -> None:
         self.store.initialize()
@@ -72,7 +80,7 @@ class CandlestickService:
             limit=limit,
             before=before,
         )
-        candles = [self._parse_candle(inst_id, row) for row in data]
+        candles = self._parse_page(inst_id, data)
         self.store.upsert_candles(candles)
         return candles
 
@@ -81,35 +89,46 @@ class CandlestickService:
         inst_id: str,
         start_ts: int,
         end_ts: int,
-    ) -> List[CandleStick]:
-        """Fetch historical candles between timestamps."""
+    ) -> CandleColumns:
+        """Fetch historical candles between timestamps, returned as compact columns."""
 
-        all_candles: List[CandleStick] = []
+        # history-candles caps page size below history_limit; a short page means no more data.
+        page_size = min(self.history_limit, OKX_HISTORY_CANDLES_MAX_LIMIT)
+        all_candles = CandleColumns(self.client.source, inst_id, self.bar)
+        pending = CandleColumns(self.client.source, inst_id, self.bar)
         cursor: Optional[int] = end_ts + 1
-        while cursor is not None and cursor > start_ts:
-            self.history_limiter.acquire()
-            data = self.client.get_candlesticks(
-                inst_id=inst_id,
-                bar=self.bar,
-                limit=self.history_limit,
-                after=str(cursor),
-                use_history=True,
-            )
-            if not data:
-                break
-            candles = [self._parse_candle(inst_id, row) for row in data]
-            filtered = [
-                candle
-                for candle in candles
-                if start_ts <= candle.ts <= end_ts
-            ]
-            if filtered:
-                self.store.upsert_candles(filtered)
-                all_candles.extend(filtered)
-            oldest = min(candle.ts for candle in candles)
-            if oldest >= cursor:
-                break
-            cursor = oldest
+        try:
+            while cursor is not None and cursor > start_ts:
+                self.history_limiter.acquire()
+                data = self.client.get_candlesticks(
+                    inst_id=inst_id,
+                    bar=self.bar,
+                    limit=self.history_limit,
+                    after=str(cursor),
+                    use_history=True,
+                )
+                if not data:
+                    break
+                # OKX returns candles newest first, so the page bounds are its ends.
+                newest = int(data[0][0])
+                oldest = int(data[-1][0])
+                if start_ts <= oldest and newest <= end_ts:
+                    rows = data
+                else:
+                    rows = [row for row in data if start_ts <= int(row[0]) <= end_ts]
+                if rows:
+                    page = self._parse_page_columns(inst_id, rows)
+                    pending.extend_columns(page)
+                    all_candles.extend_columns(page)
+                    if len(pending) >= self.history_flush_size:
+                        self.store.upsert_candles(pending)
+                        pending = CandleColumns(self.client.source, inst_id, self.bar)
+                if oldest >= cursor or len(data) < page_size:
+                    break
+                cursor = oldest
+        finally:
+            if pending:
+                self.store.upsert_candles(pending)
         return all_candles
 
     def backfill_missing(
@@ -118,28 +137,35 @@ class CandlestickService:
         start_ts: int,
         end_ts: int,
     ) -> List[int]:
-        """Detect and backfill missing timestamps."""
+        """Detect missing timestamps and backfill them one contiguous run at a time."""
 
         expected = self._expected_timestamps(start_ts, end_ts)
-        existing = set(
-            self.store.fetch_existing_timestamps(
-                self.client.source, inst_id, self.bar, start_ts, end_ts
-            )
-        )
-        missing = [ts for ts in expected if ts not in existing]
-        for ts in missing:
-            self.fetch_history(inst_id, ts, ts)
+        missing = self.store.missing_timestamps(self.client.source, inst_id, self.bar, expected)
+        for run_start, run_end in _contiguous_runs(missing, expected.step):
+            self.fetch_history(inst_id, run_start, run_end)
         return missing
 
     def fill_since_latest(self, inst_id: str) -> Optional[int]:
-        """Backfill from the latest stored candle to now."""
+        """Backfill from the latest stored candle to now.
+
+        Small gaps are filled with one bounded request for the newest candles;
+        only gaps longer than a page fall back to paging through history.
+        """
 
         latest = self.store.latest_timestamp(self.client.source, inst_id, self.bar)
         if latest is None:
             return None
-        now_ts = int(datetime.now(timezone.utc).timestamp() * 1000)
+        now_ts = time.time_ns() // 1_000_000
         if latest >= now_ts:
             return latest
+        needed = (now_ts - latest) // _bar_to_milliseconds(self.bar) + 1
+        if needed <= min(self.history_limit, OKX_CANDLES_MAX_LIMIT):
+            self.history_limiter.acquire()
+            data = self.client.get_candlesticks(inst_id=inst_id, bar=self.bar, limit=needed)
+            rows = [row for row in data if int(row[0]) >= latest]
+            if rows:
+                self.store.upsert_candles(self._parse_page_columns(inst_id, rows))
+            return latest
         self.fetch_history(inst_id, latest, now_ts)
         return latest
 
@@ -147,44 +173,110 @@ class CandlestickService:
         cutoff_ts = compute_retention_cutoff(self.retention_months)
         return self.store.delete_older_than(cutoff_ts)
 
-    def _expected_timestamps(self, start_ts: int, end_ts: int) -> List[int]:
+    def _expected_timestamps(self, start_ts: int, end_ts: int) -> range:
         interval_ms = _bar_to_milliseconds(self.bar)
         aligned_start = start_ts - (start_ts % interval_ms)
         aligned_end = end_ts - (end_ts % interval_ms)
-        return list(range(aligned_start, aligned_end + interval_ms, interval_ms))
+        return range(aligned_start, aligned_end + interval_ms, interval_ms)
 
-    def _parse_candle(self, inst_id: str, row: Iterable[str]) -> CandleStick:
-        values = list(row)
-        return CandleStick(
-            source=self.client.source,
-            inst_id=inst_id,
-            bar=self.bar,
-            ts=int(values[0]),
-            open=float(values[1]),
-            high=float(values[2]),
-            low=float(values[3]),
-            close=float(values[4]),
-            volume=float(values[5]),
-            volume_ccy=float(values[6]),
-            volume_quote=float(values[7]),
-            confirm=values[8] == "1",
+    def _parse_page(
+        self, inst_id: str, rows: Iterable[Sequence[str]]
+    ) -> List[CandleStick]:
+        """Parse a page of OKX candle rows in one pass."""
+
+        source = self.client.source
+        bar = self.bar
+        return [
+            CandleStick(
+                source,
+                inst_id,
+                bar,
+                int(ts),
+                float(open_),
+                float(high),
+                float(low),
+                float(close),
+                float(volume),
+                float(volume_ccy),
+                float(volume_quote),
+                confirm == "1",
+            )
+            for (
+                ts, open_, high, low, close, volume, volume_ccy, volume_quote, confirm, *_
+            ) in rows
+        ]
+
+    def _parse_page_columns(
+        self, inst_id: str, rows: Sequence[Sequence[str]]
+    ) -> CandleColumns:
+        """Parse a page of OKX candle rows column by column, without per-row objects."""
+
+        ts, open_, high, low, close, volume, volume_ccy, volume_quote, confirm, *_ = zip(*rows)
+        return CandleColumns(
+            self.client.source,
+            inst_id,
+            self.bar,
+            ts=array("q", map(int, ts)),
+            open=array("d", map(float, open_)),
+            high=array("d", map(float, high)),
+            low=array("d", map(float, low)),
+            close=array("d", map(float, close)),
+            volume=array("d", map(float, volume)),
+            volume_ccy=array("d", map(float, volume_ccy)),
+            volume_quote=array("d", map(float, volume_quote)),
+            confirm=array("b", [flag == "1" for flag in confirm]),
         )
 
 
+def _contiguous_runs(timestamps: Sequence[int], step: int) -> List[Tuple[int, int]]:
+    """Group sorted timestamps into (first, last) runs spaced exactly ``step`` apart."""
+
+    runs: List[Tuple[int, int]] = []
+    for ts in timestamps:
+        if runs and ts - runs[-1][1] == step:
+            runs[-1] = (runs[-1][0], ts)
+        else:
+            runs.append((ts, ts))
+    return runs
+
+
+_BAR_UNIT_MS = {
+    "s": 1000,
+    "m": 60 * 1000,
+    "H": 60 * 60 * 1000,
+    "D": 24 * 60 * 60 * 1000,
+    "W": 7 * 24 * 60 * 60 * 1000,
+    "M": 30 * 24 * 60 * 60 * 1000,
+}
+_BAR_TO_MS = {
+    "1s": 1000,
+    "1m": 60_000,
+    "3m": 180_000,
+    "5m": 300_000,
+    "15m": 900_000,
+    "30m": 1_800_000,
+    "1H": 3_600_000,
+    "2H": 7_200_000,
+    "4H": 14_400_000,
+    "6H": 21_600_000,
+    "12H": 43_200_000,
+    "1D": 86_400_000,
+    "2D": 172_800_000,
+    "3D": 259_200_000,
+    "1W": 604_800_000,
+    "1M": 2_592_000_000,
+    "3M": 7_776_000_000,
+}
+
+
 def _bar_to_milliseconds(bar: str) -> int:
-    if bar.endswith("s"):
-        return int(bar[:-1]) * 1000
-    if bar.endswith("m"):
-        return int(bar[:-1]) * 60 * 1000
-    if bar.endswith("H"):
-        return int(bar[:-1]) * 60 * 60 * 1000
-    if bar.endswith("D"):
-        return int(bar[:-1]) * 24 * 60 * 60 * 1000
-    if bar.endswith("W"):
-        return int(bar[:-1]) * 7 * 24 * 60 * 60 * 1000
-    if bar.endswith("M"):
-        return int(bar[:-1]) * 30 * 24 * 60 * 60 * 1000
-    raise ValueError(f"Unsupported bar format: {bar}")
+    interval_ms = _BAR_TO_MS.get(bar)
+    if interval_ms is not None:
+        return interval_ms
+    unit_ms = _BAR_UNIT_MS.get(bar[-1:])
+    if unit_ms is None:
+        raise ValueError(f"Unsupported bar format: {bar}")
+    return int(bar[:-1]) * unit_ms
 
 
 __all__ = ["CandlestickService", "RateLimiter"]
@@ -2,17 +2,21 @@
 
 from __future__ import annotations
 
+import heapq
 import logging
 import os
 import time
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Deque, Iterable, Tuple
+from functools import lru_cache
+from itertools import product
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
 
-from .binance import BinanceClient
-from .candles import CandlestickService
+from .binance import BINANCE_KLINES_MAX_LIMIT, BinanceClient, parse_kline_columns
+from .candles import CandlestickService, RateLimiter
 from .okx import OkxClient
-from .storage import CandleStick, SqliteCandleStore
+from .storage import CandleColumns, DatabaseBackend, open_candle_store
 
 DEFAULT_INST_IDS = [
     inst.strip()
@@ -28,7 +32,32 @@ DEFAULT_DB_PATH = os.getenv("TAUTO_DB_PATH", "candles.db")
 DEFAULT_LIMIT = int(os.getenv("TAUTO_FETCH_LIMIT", "300"))
 DEFAULT_INTERVAL = float(os.getenv("TAUTO_FETCH_INTERVAL", "15"))
 DEFAULT_QPS = float(os.getenv("TAUTO_FETCH_QPS", "10"))
+DEFAULT_WORKERS = int(os.getenv("TAUTO_FETCH_WORKERS", "8"))
 DEFAULT_BACKFILL_DAYS = int(os.getenv("TAUTO_BACKFILL_DAYS_PER_CYCLE", "3"))
+
+
+def _parse_inst_priority(value: str) -> Dict[str, int]:
+    """Parse "BTC-USDT=2,ETH-USDT=1"; malformed entries are skipped with a warning."""
+
+    priorities: Dict[str, int] = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        inst, separator, weight = entry.partition("=")
+        try:
+            if not separator or not inst.strip():
+                raise ValueError(entry)
+            priorities[inst.strip()] = int(weight)
+        except ValueError:
+            logging.getLogger(__name__).warning(
+                "Ignoring malformed TAUTO_INST_PRIORITY entry %r (expected INST=WEIGHT)",
+                entry.strip(),
+            )
+    return priorities
+
+
+# Within a day, higher weights are backfilled first (default 0).
+DEFAULT_INST_PRIORITY = _parse_inst_priority(os.getenv("TAUTO_INST_PRIORITY", ""))
 DEFAULT_BARS = [
     "1m",
     "5m",
@@ -64,41 +93,88 @@ DEFAULT_BINANCE_BARS = [
 ]
 
 
+_UNIT_MS = {
+    "s": 1000,
+    "m": 60 * 1000,
+    "H": 60 * 60 * 1000,
+    "h": 60 * 60 * 1000,
+    "D": 24 * 60 * 60 * 1000,
+    "d": 24 * 60 * 60 * 1000,
+    "W": 7 * 24 * 60 * 60 * 1000,
+    "w": 7 * 24 * 60 * 60 * 1000,
+    "M": 30 * 24 * 60 * 60 * 1000,
+}
+# OKX and Binance spell some units differently but never disagree on a bar's length.
+_BAR_MS = {
+    bar: int(bar[:-1]) * _UNIT_MS[bar[-1]] for bar in (*DEFAULT_BARS, *DEFAULT_BINANCE_BARS)
+}
+
+
+# (-day_start, -priority, source, inst_id, day_end): heapq pops the newest, hottest first.
+BackfillEntry = Tuple[int, int, str, str, int]
+# source -> (inst_ids, {bar: service}); built once in run_fetcher and shared by reference.
+SourcesConfig = Dict[str, Tuple[Iterable[str], Dict[str, object]]]
+
+
 class BinanceBackfillService:
     """Binance candlestick backfill helper."""
 
     source: str = "binance"
 
-    def __init__(self, client: BinanceClient, store: SqliteCandleStore, bar: str) -> None:
+    def __init__(
+        self,
+        client: BinanceClient,
+        store: DatabaseBackend,
+        bar: str,
+        flush_size: int = 5000,
+        limiter: Optional[RateLimiter] = None,
+    ) -> None:
         self.client = client
         self.store = store
         self.bar = bar
+        self.flush_size = flush_size
+        self.limiter = limiter
 
-    def fetch_history(self, inst_id: str, start_ts: int, end_ts: int) -> list[CandleStick]:
-        interval_ms = _binance_interval_ms(self.bar)
-        all_candles: list[CandleStick] = []
-        cursor = end_ts
-        while cursor >= start_ts:
-            klines = self.client.get_klines(
-                symbol=inst_id,
-                interval=self.bar,
-                limit=1000,
-                start_time=start_ts,
-                end_time=cursor,
-            )
-            if not klines:
-                break
-            candles = [_parse_binance_kline(inst_id, self.bar, row) for row in klines]
-            filtered = [
-                candle
-                for candle in candles
-                if start_ts <= candle.ts <= end_ts
-            ]
-            if filtered:
-                self.store.upsert_candles(filtered)
-                all_candles.extend(filtered)
-            oldest = min(candle.ts for candle in candles)
-            cursor = oldest - interval_ms
+    def fetch_history(self, inst_id: str, start_ts: int, end_ts: int) -> CandleColumns:
+        all_candles = CandleColumns(self.source, inst_id, self.bar)
+        pending = CandleColumns(self.source, inst_id, self.bar)
+        cursor = start_ts
+        try:
+            # Binance returns the oldest klines from startTime first, so page forwards.
+            while cursor <= end_ts:
+                if self.limiter is not None:
+                    self.limiter.acquire()
+                klines = self.client.get_klines(
+                    symbol=inst_id,
+                    interval=self.bar,
+                    limit=BINANCE_KLINES_MAX_LIMIT,
+                    start_time=cursor,
+                    end_time=end_ts,
+                )
+                if not klines:
+                    break
+                # Klines come back oldest first, so the page bounds are its ends.
+                oldest = int(klines[0][0])
+                newest = int(klines[-1][0])
+                if start_ts <= oldest and newest <= end_ts:
+                    rows = klines
+                else:
+                    rows = [row for row in klines if start_ts <= int(row[0]) <= end_ts]
+                if rows:
+                    page = parse_kline_columns(inst_id, self.bar, rows)
+                    pending.extend_columns(page)
+                    all_candles.extend_columns(page)
+                    # Pages are written in large batches so each commit covers many rows.
+                    if len(pending) >= self.flush_size:
+                        self.store.upsert_candles(pending)
+                        pending = CandleColumns(self.source, inst_id, self.bar)
+                # A short page means the window is exhausted; skip the extra empty request.
+                if len(klines) < BINANCE_KLINES_MAX_LIMIT:
+                    break
+                cursor = newest + 1
+        finally:
+            if pending:
+                self.store.upsert_candles(pending)
         return all_candles
 
 
@@ -107,66 +183,101 @@ def run_fetcher() -> None:
         level=logging.INFO,
         format="%(asctime)s %(levelname)s %(name)s - %(message)s",
     )
-    store = SqliteCandleStore(DEFAULT_DB_PATH)
+    # Commits run on the store's writer thread, so refresh workers never wait on them.
+    store = open_candle_store(DEFAULT_DB_PATH, background_writes=True)
     store.initialize()
     okx_client = OkxClient()
     binance_client = BinanceClient()
+    # One budget for every OKX request, however many refreshes run at once.
+    limiter = RateLimiter(DEFAULT_QPS)
     okx_services = {}
     for bar in DEFAULT_BARS:
-        service = CandlestickService(client=okx_client, store=store, bar=bar)
+        service = CandlestickService(
+            client=okx_client,
+            store=store,
+            bar=bar,
+            history_limiter=limiter,
+            realtime_limiter=limiter,
+        )
         service.initialize()
         okx_services[bar] = service
+    binance_limiter = RateLimiter(DEFAULT_QPS)
     binance_services = {}
     for bar in DEFAULT_BINANCE_BARS:
         binance_services[bar] = BinanceBackfillService(
-            client=binance_client, store=store, bar=bar
+            client=binance_client, store=store, bar=bar, limiter=binance_limiter
         )
-    min_interval = 1 / max(DEFAULT_QPS, 1)
-    day_queue = _build_missing_day_queue_multi(
-        store,
-        {
-            "okx": (DEFAULT_INST_IDS, okx_services),
-            "binance": (DEFAULT_BINANCE_INST_IDS, binance_services),
-        },
-        int(datetime.now(timezone.utc).timestamp() * 1000),
-    )
+    sources = {
+        "okx": (DEFAULT_INST_IDS, okx_services),
+        "binance": (DEFAULT_BINANCE_INST_IDS, binance_services),
+    }
+    day_queue = _build_missing_day_queue_multi(store, sources, time.time_ns() // 1_000_000)
 
+    logger = logging.getLogger(__name__)
+    executor = ThreadPoolExecutor(max_workers=max(DEFAULT_WORKERS, 1))
     while True:
-        cycle_start = time.time()
-        for inst_id in DEFAULT_INST_IDS:
-            for bar, service in okx_services.items():
-                try:
-                    _refresh_candles(service, store, inst_id, bar, DEFAULT_LIMIT)
-                except Exception:  # noqa: BLE001 - keep fetcher alive on transient failures
-                    logging.getLogger(__name__).exception(
-                        "Failed to refresh candles for %s (%s)", inst_id, bar
-                    )
-                time.sleep(min_interval)
-        try:
-            _process_backfill_queue_multi(
-                day_queue,
-                {
-                    "okx": (DEFAULT_INST_IDS, okx_services),
-                    "binance": (DEFAULT_BINANCE_INST_IDS, binance_services),
-                },
+        cycle_start = time.monotonic()
+        # One wall-clock reading per cycle, shared by every refresh job.
+        now_ts = time.time_ns() // 1_000_000
+        refreshes = [
+            executor.submit(
+                _refresh_candles_safely,
+                okx_services[bar],
                 store,
-                DEFAULT_BACKFILL_DAYS,
+                inst_id,
+                bar,
+                DEFAULT_LIMIT,
+                now_ts,
             )
+            for inst_id, bar in product(DEFAULT_INST_IDS, okx_services)
+        ]
+        # Backfills share the pool with the refreshes: each exchange has its own
+        # limiter, so Binance work proceeds while OKX requests wait for tokens.
+        try:
+            backfill_jobs = _take_backfill_jobs(day_queue, sources, store, DEFAULT_BACKFILL_DAYS)
         except Exception:  # noqa: BLE001 - keep fetcher alive on transient failures
-            logging.getLogger(__name__).exception("Failed to process backfill queue")
-        elapsed = time.time() - cycle_start
-        time.sleep(max(0, DEFAULT_INTERVAL - elapsed))
+            logger.exception("Failed to process backfill queue")
+            backfill_jobs = []
+        backfills = [executor.submit(_backfill_day, store, *job) for job in backfill_jobs]
+        for future in refreshes:
+            future.result()
+        for future in backfills:
+            try:
+                future.result()
+            except Exception:  # noqa: BLE001 - keep fetcher alive on transient failures
+                logger.exception("Failed to process backfill queue")
+        # Monotonic time is immune to NTP steps; the clamp bounds the pause either way.
+        elapsed = time.monotonic() - cycle_start
+        time.sleep(min(max(0.0, DEFAULT_INTERVAL - elapsed), DEFAULT_INTERVAL))
+
+
+def _refresh_candles_safely(
+    service: CandlestickService,
+    store: DatabaseBackend,
+    inst_id: str,
+    bar: str,
+    limit: int,
+    now_ts: Optional[int] = None,
+) -> None:
+    try:
+        _refresh_candles(service, store, inst_id, bar, limit, now_ts)
+    except Exception:  # noqa: BLE001 - keep fetcher alive on transient failures
+        logging.getLogger(__name__).exception(
+            "Failed to refresh candles for %s (%s)", inst_id, bar
+        )
 
 
 def _refresh_candles(
     service: CandlestickService,
-    store: SqliteCandleStore,
+    store: DatabaseBackend,
     inst_id: str,
     bar: str,
     limit: int,
+    now_ts: Optional[int] = None,
 ) -> None:
     latest = store.latest_timestamp(service.client.source, inst_id, bar)
-    now_ts = int(datetime.now(timezone.utc).timestamp() * 1000)
+    if now_ts is None:
+        now_ts = time.time_ns() // 1_000_000
     if latest is None:
         interval_ms = _bar_to_milliseconds(bar)
         start_ts = max(_three_months_ago(now_ts), now_ts - (limit * interval_ms))
@@ -207,19 +318,10 @@ def _refresh_candles(
 
 
 def _bar_to_milliseconds(bar: str) -> int:
-    if bar.endswith("s"):
-        return int(bar[:-1]) * 1000
-    if bar.endswith("m"):
-        return int(bar[:-1]) * 60 * 1000
-    if bar.endswith("H"):
-        return int(bar[:-1]) * 60 * 60 * 1000
-    if bar.endswith("D"):
-        return int(bar[:-1]) * 24 * 60 * 60 * 1000
-    if bar.endswith("W"):
-        return int(bar[:-1]) * 7 * 24 * 60 * 60 * 1000
-    if bar.endswith("M"):
-        return int(bar[:-1]) * 30 * 24 * 60 * 60 * 1000
-    raise ValueError(f"Unsupported bar format: {bar}")
+    interval_ms = _BAR_MS.get(bar)
+    if interval_ms is None:
+        raise ValueError(f"Unsupported bar format: {bar}")
+    return interval_ms
 
 
 def _three_months_ago(now_ts: int) -> int:
@@ -231,147 +333,180 @@ def _build_day_queue(now_ts: int) -> Deque[Tuple[int, int]]:
     start_ts = _three_months_ago(now_ts)
     end_day_start = _day_start_ts(now_ts)
     start_day_start = _day_start_ts(start_ts)
-    days = deque()
-    current = end_day_start
-    while current >= start_day_start:
-        day_end = min(current + day_ms - 1, now_ts)
-        days.append((current, day_end))
-        current -= day_ms
+    # Only today's window is cut short at now_ts; every earlier day is a full day.
+    days: Deque[Tuple[int, int]] = deque(
+        (day_start, day_start + day_ms - 1)
+        for day_start in range(end_day_start - day_ms, start_day_start - 1, -day_ms)
+    )
+    days.appendleft((end_day_start, now_ts))
     return days
 
 
 def _build_missing_day_queue_multi(
-    store: SqliteCandleStore,
-    sources: dict[str, tuple[Iterable[str], dict[str, object]]],
+    store: DatabaseBackend,
+    sources: SourcesConfig,
     now_ts: int,
-) -> Deque[Tuple[str, int, int]]:
+    priorities: Optional[Dict[str, int]] = None,
+) -> List[BackfillEntry]:
+    """Heap of incomplete (source, inst_id, day) windows, newest day first.
+
+    Days tie-break on the instrument's priority weight, so hot symbols are
+    filled before the rest of the same day.
+    """
+
     logger = logging.getLogger(__name__)
-    day_queue: Deque[Tuple[str, int, int]] = deque()
-    for day_start, day_end in _build_day_queue(now_ts):
-        for source, (inst_ids, services) in sources.items():
-            if _day_has_missing(store, source, inst_ids, services, day_start, day_end):
-                day_queue.append((source, day_start, day_end))
+    priorities = DEFAULT_INST_PRIORITY if priorities is None else priorities
+    days = _build_day_queue(now_ts)
+    day_queue: List[BackfillEntry] = []
+    if not days:
+        return day_queue
+    day_ms = 24 * 60 * 60 * 1000
+    window_start = days[-1][0]
+    window_end = days[0][1]
+    day_ends = dict(days)
+    incomplete: set[Tuple[str, str, int]] = set()
+    for source, (inst_ids, services) in sources.items():
+        for inst_id in inst_ids:
+            for bar in services:
+                # Days already proven complete never change, so only the rest are scanned.
+                known_complete = store.fetch_complete_days(source, inst_id, bar, window_start)
+                pending = [day for day in days if day[0] not in known_complete]
+                if not pending:
+                    continue
+                # One range scan per series; each day is then checked in memory.
+                existing = set(
+                    store.fetch_existing_timestamps(
+                        source,
+                        inst_id,
+                        bar,
+                        min(_expected_slots(source, bar, *pending[-1])),
+                        window_end,
+                    )
+                )
+                newly_complete = []
+                for day_start, day_end in pending:
+                    if existing.issuperset(_expected_slots(source, bar, day_start, day_end)):
+                        # The current (partial) day may still gain candles; skip marking it.
+                        if day_end == day_start + day_ms - 1:
+                            newly_complete.append(day_start)
+                    else:
+                        incomplete.add((source, inst_id, day_start))
+                store.mark_days_complete(source, inst_id, bar, newly_complete)
+    for source, inst_id, day_start in incomplete:
+        day_queue.append(
+            (-day_start, -priorities.get(inst_id, 0), source, inst_id, day_ends[day_start])
+        )
+    heapq.heapify(day_queue)
     if not day_queue:
         logger.info("No missing candles detected in the last 3 months window.")
     return day_queue
 
 
 def _day_start_ts(ts: int) -> int:
-    dt = datetime.fromtimestamp(ts / 1000, tz=timezone.utc)
-    day_start = dt.replace(hour=0, minute=0, second=0, microsecond=0)
-    return int(day_start.timestamp() * 1000)
+    # UTC days have no DST shifts, so truncating to the day is plain arithmetic.
+    return ts - ts % (24 * 60 * 60 * 1000)
 
 
-def _process_backfill_queue_multi(
-    day_queue: Deque[Tuple[str, int, int]],
-    sources: dict[str, tuple[Iterable[str], dict[str, object]]],
-    store: SqliteCandleStore,
+def _take_backfill_jobs(
+    day_queue: List[BackfillEntry],
+    sources: SourcesConfig,
+    store: DatabaseBackend,
     days_per_cycle: int,
-) -> None:
+) -> List[Tuple[str, str, str, object, int, int]]:
+    """Pop this cycle's days off the queue as (source, inst_id, bar, service, start, end) jobs."""
+
     if not day_queue:
+        # The rebuilt list is already a heap; extending an empty heap keeps the invariant.
         day_queue.extend(
             _build_missing_day_queue_multi(
                 store,
                 sources,
-                int(datetime.now(timezone.utc).timestamp() * 1000),
+                time.time_ns() // 1_000_000,
             )
         )
     if days_per_cycle <= 0:
+        return []
+    jobs = []
+    days_taken: set[int] = set()
+    # Take every queued series of the newest days_per_cycle days, hot symbols first.
+    while day_queue and (
+        len(days_taken) < days_per_cycle or -day_queue[0][0] in days_taken
+    ):
+        neg_day_start, _, source, inst_id, day_end = heapq.heappop(day_queue)
+        days_taken.add(-neg_day_start)
+        _, services = sources[source]
+        for bar, service in services.items():
+            jobs.append((source, inst_id, bar, service, -neg_day_start, day_end))
+    return jobs
+
+
+def _backfill_day(
+    store: DatabaseBackend,
+    source: str,
+    inst_id: str,
+    bar: str,
+    service: object,
+    day_start: int,
+    day_end: int,
+) -> None:
+    missing = _find_missing_in_day(store, source, inst_id, bar, day_start, day_end)
+    if not missing:
         return
-    logger = logging.getLogger(__name__)
-    for _ in range(min(days_per_cycle, len(day_queue))):
-        source, day_start, day_end = day_queue.popleft()
-        inst_ids, services = sources[source]
-        for inst_id in inst_ids:
-            for bar, service in services.items():
-                missing = _find_missing_in_day(
-                    store, source, inst_id, bar, day_start, day_end
-                )
-                if not missing:
-                    continue
-                service.fetch_history(inst_id, day_start, day_end)
-                first_missing = min(missing)
-                last_missing = max(missing)
-                logger.info(
-                    "Backfilled %s missing candles for %s:%s (%s) on %s (missing %s - %s)",
-                    len(missing),
-                    source,
-                    inst_id,
-                    bar,
-                    datetime.fromtimestamp(day_start / 1000, tz=timezone.utc).date(),
-                    _format_ts(first_missing),
-                    _format_ts(last_missing),
-                )
+    service.fetch_history(inst_id, day_start, day_end)
+    logging.getLogger(__name__).info(
+        "Backfilled %s missing candles for %s:%s (%s) on %s (missing %s - %s)",
+        len(missing),
+        source,
+        inst_id,
+        bar,
+        datetime.fromtimestamp(day_start / 1000, tz=timezone.utc).date(),
+        _format_ts(missing[0]),
+        _format_ts(missing[-1]),
+    )
 
 
 def _find_missing_in_day(
-    store: SqliteCandleStore,
+    store: DatabaseBackend,
     source: str,
     inst_id: str,
     bar: str,
     day_start: int,
     day_end: int,
 ) -> list[int]:
+    return store.missing_timestamps(
+        source, inst_id, bar, _expected_slots(source, bar, day_start, day_end)
+    )
+
+
+def _expected_slots(source: str, bar: str, day_start: int, day_end: int) -> frozenset[int]:
+    """Bar open times covering a day; shared by every instrument on that bar."""
+
+    # Only full days repeat from cycle to cycle. Today's window ends at the wall clock,
+    # so caching it would add a fresh one-off set every cycle and evict the full days.
+    if day_end == day_start + 24 * 60 * 60 * 1000 - 1:
+        return _full_day_slots(source, bar, day_start)
+    return _slots_between(source, bar, day_start, day_end)
+
+
+@lru_cache(maxsize=4096)
+def _full_day_slots(source: str, bar: str, day_start: int) -> frozenset[int]:
+    return _slots_between(source, bar, day_start, day_start + 24 * 60 * 60 * 1000 - 1)
+
+
+def _slots_between(source: str, bar: str, day_start: int, day_end: int) -> frozenset[int]:
     interval_ms = (
         _binance_interval_ms(bar) if source == "binance" else _bar_to_milliseconds(bar)
     )
     aligned_start = day_start - (day_start % interval_ms)
     aligned_end = day_end - (day_end % interval_ms)
-    expected = list(range(aligned_start, aligned_end + interval_ms, interval_ms))
-    existing = set(
-        store.fetch_existing_timestamps(
-            source, inst_id, bar, aligned_start, aligned_end
-        )
-    )
-    return [ts for ts in expected if ts not in existing]
-
-
-def _day_has_missing(
-    store: SqliteCandleStore,
-    source: str,
-    inst_ids: Iterable[str],
-    services: dict[str, object],
-    day_start: int,
-    day_end: int,
-) -> bool:
-    for inst_id in inst_ids:
-        for bar in services:
-            if _find_missing_in_day(store, source, inst_id, bar, day_start, day_end):
-                return True
-    return False
-
-
-def _parse_binance_kline(inst_id: str, bar: str, row: list) -> CandleStick:
-    return CandleStick(
-        source="binance",
-        inst_id=inst_id,
-        bar=bar,
-        ts=int(row[0]),
-        open=float(row[1]),
-        high=float(row[2]),
-        low=float(row[3]),
-        close=float(row[4]),
-        volume=float(row[5]),
-        volume_ccy=float(row[7]) if len(row) > 7 else 0.0,
-        volume_quote=float(row[7]) if len(row) > 7 else 0.0,
-        confirm=True,
-    )
+    return frozenset(range(aligned_start, aligned_end + interval_ms, interval_ms))
 
 
 def _binance_interval_ms(interval: str) -> int:
-    unit = interval[-1]
-    value = int(interval[:-1])
-    if unit == "m":
-        return value * 60 * 1000
-    if unit == "h":
-        return value * 60 * 60 * 1000
-    if unit == "d":
-        return value * 24 * 60 * 60 * 1000
-    if unit == "w":
-        return value * 7 * 24 * 60 * 60 * 1000
-    if unit == "M":
-        return value * 30 * 24 * 60 * 60 * 1000
-    raise ValueError(f"Unsupported interval: {interval}")
+    interval_ms = _BAR_MS.get(interval)
+    if interval_ms is None:
+        raise ValueError(f"Unsupported interval: {interval}")
+    return interval_ms
 
 
 def _format_ts(ts: int) -> str:
@@ -2,11 +2,13 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import time
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 
 
 class OkxApiError(RuntimeError):
@@ -14,6 +16,9 @@ class OkxApiError(RuntimeError):
 
 
 OKX_ORDERBOOK_MAX_DEPTH = 400
+OKX_CANDLES_MAX_LIMIT = 300
+OKX_HISTORY_CANDLES_MAX_LIMIT = 100
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
 
 
 @dataclass
@@ -25,40 +30,94 @@ class OkxClient:
     timeout: float = 10.0
     max_retries: int = 3
     retry_backoff: float = 0.5
-    def _compute_backoff(self, attempt: int) -> float:
-        return self.retry_backoff * (2 ** (attempt - 1))
+    pool_connections: int = 4
+    pool_maxsize: int = 16
+    instruments_ttl: float = 300.0
+    # 重试退避等待函数，测试可注入假实现而无需 patch time.sleep。
+    sleep: Callable[[float], None] = field(default=time.sleep, repr=False)
+    session: requests.Session = field(default_factory=requests.Session, init=False, repr=False)
+    _instruments_cache: Dict[str, Tuple[float, List[Dict[str, Any]]]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    def __post_init__(self) -> None:
+        # 重试由 _request 统一处理，连接池只负责 keep-alive 复用。
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self) -> None:
+        """关闭连接池中保持的 keep-alive 连接。"""
+
+        self.session.close()
+
+    def _compute_backoff(self, attempt: int, exc: Optional[Exception] = None) -> float:
+        backoff = self.retry_backoff * (2 ** (attempt - 1))
+        response = getattr(exc, "response", None)
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            # 限流响应给出的等待时间优先；只支持秒数形式。
+            try:
+                return max(backoff, float(retry_after))
+            except ValueError:
+                pass
+        return backoff
 
     def _request(self, path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         url = f"{self.base_url}{path}"
         last_error: Exception | None = None
         for attempt in range(1, self.max_retries + 1):
             try:
-                response = requests.get(url, params=params, timeout=self.timeout)
+                response = self.session.get(url, params=params, timeout=self.timeout)
                 response.raise_for_status()
-                payload = response.json()
+                payload = orjson.loads(response.content)
                 if payload.get("code") != "0":
                     raise OkxApiError(f"OKX API error: {payload}")
                 return payload
             except (requests.RequestException, ValueError, OkxApiError) as exc:
                 last_error = exc
+                response = getattr(exc, "response", None)
+                status = response.status_code if response is not None else None
+                # 除限流外的 4xx 重试也不会成功，直接抛出。
+                if status is not None and status < 500 and status not in RETRY_STATUS_CODES:
+                    raise
                 if attempt >= self.max_retries:
                     raise
-                time.sleep(self._compute_backoff(attempt))
+                self.sleep(self._compute_backoff(attempt, exc))
         if last_error:
             raise last_error
         raise RuntimeError("Unexpected request failure without exception.")
 
     def list_instruments(self, inst_type: str = "SPOT") -> List[Dict[str, Any]]:
-        """获取指定类型的交易产品列表（SPOT、SWAP、FUTURES、OPTION）。"""
+        """获取指定类型的交易产品列表（SPOT、SWAP、FUTURES、OPTION），结果按 TTL 缓存。"""
+        cached = self._instruments_cache.get(inst_type)
+        if cached is not None and time.monotonic() < cached[0]:
+            return list(cached[1])
         payload = self._request("/api/v5/public/instruments", {"instType": inst_type})
-        return payload.get("data", [])
+        instruments = payload.get("data", [])
+        if self.instruments_ttl > 0:
+            self._instruments_cache[inst_type] = (
+                time.monotonic() + self.instruments_ttl,
+                instruments,
+            )
+        return list(instruments)
+
+    def invalidate_instruments(self, inst_type: Optional[str] = None) -> None:
+        """清除交易产品列表缓存；不指定类型时清除全部。"""
+        if inst_type is None:
+            self._instruments_cache.clear()
+        else:
+            self._instruments_cache.pop(inst_type, None)
 
     def get_order_book(self, inst_id: str, depth: int = 5) -> Dict[str, Any]:
         """获取指定交易对的盘口数据。"""
         resolved_depth = min(max(depth, 1), OKX_ORDERBOOK_MAX_DEPTH)
         payload = self._request(
             "/api/v5/market/books",
-            {"instId": inst_id, "sz": str(resolved_depth)},
+            {"instId": inst_id, "sz": resolved_depth},
         )
         data = payload.get("data", [])
         return data[0] if data else {}
@@ -67,7 +126,7 @@ class OkxClient:
         """获取指定交易对的最新成交数据（用于分时图/成交明细）。"""
         payload = self._request(
             "/api/v5/market/trades",
-            {"instId": inst_id, "limit": str(limit)},
+            {"instId": inst_id, "limit": limit},
         )
         return payload.get("data", [])
 
@@ -90,7 +149,7 @@ class OkxClient:
         use_history: bool = False,
     ) -> List[List[str]]:
         """获取指定交易对的 K 线数据，支持不同周期，用于绘制 K 线。"""
-        params: Dict[str, Any] = {"instId": inst_id, "bar": bar, "limit": str(limit)}
+        params: Dict[str, Any] = {"instId": inst_id, "bar": bar, "limit": limit}
         if after:
             params["after"] = after
         if before:
@@ -105,4 +164,11 @@ def summarize_instruments(instruments: Iterable[Dict[str, Any]]) -> List[str]:
     return [instrument.get("instId", "") for instrument in instruments]
 
 
-__all__ = ["OKX_ORDERBOOK_MAX_DEPTH", "OkxApiError", "OkxClient", "summarize_instruments"]
+__all__ = [
+    "OKX_CANDLES_MAX_LIMIT",
+    "OKX_HISTORY_CANDLES_MAX_LIMIT",
+    "OKX_ORDERBOOK_MAX_DEPTH",
+    "OkxApiError",
+    "OkxClient",
+    "summarize_instruments",
+]
@@ -3,8 +3,18 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Mapping, MutableMapping, Sequence
 import os
+import re
+
+
+# Environment variable names checked for each setting, upper-case first.
+_ENV_KEYS = {
+    "http": ("HTTP_PROXY", "http_proxy"),
+    "https": ("HTTPS_PROXY", "https_proxy"),
+}
+_NO_PROXY_TOKEN = re.compile(r"[^,\s]+")
 
 
 @dataclass(frozen=True)
@@ -16,14 +26,18 @@ class ProxyConfig:
 
 
 def _normalize_no_proxy(value: str | Sequence[str] | None) -> tuple[str, ...]:
-    if value is None:
-        return tuple()
+    if not value:
+        return ()
     if isinstance(value, str):
-        parts = [segment.strip() for segment in value.split(",")]
-    else:
-        parts = [str(segment).strip() for segment in value]
-    cleaned = [segment for segment in parts if segment]
-    return tuple(cleaned)
+        return _split_no_proxy(value)
+    return tuple(filter(None, (str(segment).strip() for segment in value)))
+
+
+@lru_cache(maxsize=256)
+def _split_no_proxy(value: str) -> tuple[str, ...]:
+    # One C-level scan yields only non-empty, already stripped entries; the same
+    # NO_PROXY string is parsed only once per process.
+    return tuple(_NO_PROXY_TOKEN.findall(value))
 
 
 def load_proxy_config(
@@ -48,7 +62,7 @@ def load_proxy_config(
         enabled = bool(enabled_setting)
 
     if not enabled:
-        return ProxyConfig(enabled=False, http=None, https=None, no_proxy=tuple())
+        return ProxyConfig(enabled=False, http=None, https=None, no_proxy=())
 
     return ProxyConfig(
         enabled=True,
@@ -67,7 +81,8 @@ def _coalesce_setting(
     if isinstance(value, str) and value:
         return value
 
-    env_value = env.get(key.upper() + "_PROXY") or env.get(key + "_proxy")
+    upper_key, lower_key = _ENV_KEYS[key]
+    env_value = env.get(upper_key) or env.get(lower_key)
     return env_value or None
 
 
@@ -2,77 +2,137 @@
 
 from __future__ import annotations
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import hashlib
+from itertools import islice
 import logging
 import os
 from pathlib import Path
+import threading
 import time
-from typing import Optional
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Hashable, Iterator, Mapping, Optional
 
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+import orjson
 
-from .binance import BinanceClient
+from .binance import BINANCE_KLINES_MAX_LIMIT, BinanceClient, parse_kline_columns
+from .candles import RateLimiter
 from .okx import OKX_ORDERBOOK_MAX_DEPTH, OkxClient
-from .storage import CandleStick, SqliteCandleStore
+from .storage import CandleColumns, open_candle_store
 
 BASE_DIR = Path(__file__).resolve().parent
 WEB_DIR = BASE_DIR / "web"
 
-SUPPORTED_BARS = {
-    "1m": "1m",
-    "5m": "5m",
-    "15m": "15m",
-    "30m": "30m",
-    "1h": "1H",
-    "1H": "1H",
-    "2h": "2H",
-    "2H": "2H",
-    "4h": "4H",
-    "4H": "4H",
-    "6h": "6H",
-    "6H": "6H",
-    "12h": "12H",
-    "12H": "12H",
-    "1d": "1D",
-    "1D": "1D",
-    "2d": "2D",
-    "2D": "2D",
-    "3d": "3D",
-    "3D": "3D",
-    "1w": "1W",
-    "1W": "1W",
-    "1M": "1M",
-    "3m": "3M",
-    "3M": "3M",
-}
-BINANCE_BARS = {
-    "1m": "1m",
-    "3m": "3m",
-    "5m": "5m",
-    "15m": "15m",
-    "30m": "30m",
-    "1h": "1h",
-    "2h": "2h",
-    "4h": "4h",
-    "6h": "6h",
-    "12h": "12h",
-    "1d": "1d",
-    "3d": "3d",
-    "1w": "1w",
-    "1M": "1M",
-}
+SUPPORTED_BARS = MappingProxyType(
+    {
+        "1m": "1m",
+        "5m": "5m",
+        "15m": "15m",
+        "30m": "30m",
+        "1h": "1H",
+        "1H": "1H",
+        "2h": "2H",
+        "2H": "2H",
+        "4h": "4H",
+        "4H": "4H",
+        "6h": "6H",
+        "6H": "6H",
+        "12h": "12H",
+        "12H": "12H",
+        "1d": "1D",
+        "1D": "1D",
+        "2d": "2D",
+        "2D": "2D",
+        "3d": "3D",
+        "3D": "3D",
+        "1w": "1W",
+        "1W": "1W",
+        "1M": "1M",
+        "3m": "3M",
+        "3M": "3M",
+    }
+)
+BINANCE_BARS = MappingProxyType(
+    {
+        "1m": "1m",
+        "3m": "3m",
+        "5m": "5m",
+        "15m": "15m",
+        "30m": "30m",
+        "1h": "1h",
+        "2h": "2h",
+        "4h": "4h",
+        "6h": "6h",
+        "12h": "12h",
+        "1d": "1d",
+        "3d": "3d",
+        "1w": "1w",
+        "1M": "1M",
+    }
+)
 BINANCE_SPOT_SOURCE = "binance"
 
-VALID_SOURCES = {"okx", BINANCE_SPOT_SOURCE}
+VALID_SOURCES = frozenset({"okx", BINANCE_SPOT_SOURCE})
+# (source, requested bar) -> stored bar, so one lookup validates both query parameters.
+RESOLVED_BARS = MappingProxyType(
+    {
+        **{("okx", bar): normalized for bar, normalized in SUPPORTED_BARS.items()},
+        **{(BINANCE_SPOT_SOURCE, bar): normalized for bar, normalized in BINANCE_BARS.items()},
+    }
+)
+TICKER_CACHE_TTL_SECONDS = 0.5
+# Polls for the latest Binance candles within this window reuse the previous pull.
+BINANCE_REFRESH_MIN_INTERVAL_SECONDS = 0.5
+# Concurrent kline requests per Binance history backfill.
+BINANCE_BACKFILL_CONCURRENCY = 5
+# Budget for every Binance kline request the server makes, however many run at once.
+BINANCE_REQUESTS_PER_SECOND = 10.0
+# Read-only SQLite connections shared by request handlers, so chart reads never
+# queue behind an upsert on the store's write connection.
+STORE_READ_POOL_SIZE = 4
+
+
+@dataclass(frozen=True)
+class ServerSettings:
+    """Environment-driven server settings, read once at import."""
+
+    inst_id: str = "BTC-USDT"
+    db_path: str = "candles.db"
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None) -> "ServerSettings":
+        env = os.environ if env is None else env
+        return cls(
+            inst_id=env.get("TAUTO_INST_ID", cls.inst_id),
+            db_path=env.get("TAUTO_DB_PATH", cls.db_path),
+        )
+
+
+SETTINGS = ServerSettings.from_env()
+
 
-DEFAULT_INST_ID = os.getenv("TAUTO_INST_ID", "BTC-USDT")
-DEFAULT_DB_PATH = os.getenv("TAUTO_DB_PATH", "candles.db")
+class ORJSONResponse(JSONResponse):
+    """JSON response encoded by orjson, which serializes dicts and floats in C."""
 
-app = FastAPI(title="TAuto K-Line Service")
-store = SqliteCandleStore(DEFAULT_DB_PATH)
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+app = FastAPI(title="TAuto K-Line Service", default_response_class=ORJSONResponse)
+# Candle JSON repeats the same keys on every row and compresses several-fold; level 1
+# keeps the CPU cost per MB low.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=1)
+store = open_candle_store(SETTINGS.db_path, read_pool_size=STORE_READ_POOL_SIZE)
 okx_client = OkxClient()
 binance_client = BinanceClient()
+binance_limiter = RateLimiter(BINANCE_REQUESTS_PER_SECOND)
 
 
 @app.on_event("startup")
@@ -84,18 +144,32 @@ def _startup() -> None:
     store.initialize()
 
 
+@app.on_event("shutdown")
+def _shutdown() -> None:
+    # The clients and the store keep their connections open for the life of the process.
+    okx_client.close()
+    binance_client.close()
+    store.close()
+
+
 app.mount("/static", StaticFiles(directory=WEB_DIR), name="static")
 
 
+# The page is static for the life of the process: read it once, tag it once.
+_INDEX_HTML = (WEB_DIR / "index.html").read_bytes()
+_INDEX_ETAG = f'"{hashlib.blake2b(_INDEX_HTML, digest_size=8).hexdigest()}"'
+
+
 @app.get("/", response_class=HTMLResponse)
-def index() -> HTMLResponse:
-    html_path = WEB_DIR / "index.html"
-    return HTMLResponse(html_path.read_text(encoding="utf-8"))
+async def index(request: Request) -> Response:
+    if request.headers.get("if-none-match") == _INDEX_ETAG:
+        return Response(status_code=304, headers={"ETag": _INDEX_ETAG})
+    return HTMLResponse(_INDEX_HTML, headers={"ETag": _INDEX_ETAG})
 
 
 @app.get("/api/candles")
-def get_candles(
-    inst_id: str = Query(DEFAULT_INST_ID, description="Instrument ID"),
+async def get_candles(
+    inst_id: str = Query(SETTINGS.inst_id, description="Instrument ID"),
     bar: str = Query("1m", description="Candlestick bar"),
     limit: Optional[int] = Query(300, ge=1, le=2000),
     source: str = Query("okx", description="Data source (okx/binance)"),
@@ -108,36 +182,67 @@ def get_candles(
     end_ts: Optional[int] = Query(
         None, description="Return candles older than or equal to the provided timestamp."
     ),
+) -> Response:
+    # Validation runs on the event loop; only the blocking store/HTTP work is offloaded.
+    normalized = _resolve_bar(source, bar)
+    if all_data:
+        if source == BINANCE_SPOT_SOURCE:
+            await run_in_threadpool(
+                _binance_fetches.do,
+                (BINANCE_SPOT_SOURCE, inst_id, normalized, "history"),
+                _backfill_binance_history,
+                inst_id,
+                normalized,
+            )
+            # The full Binance history ignores end_ts, as it always has.
+            end_ts = None
+        # A full series can be tens of thousands of candles; stream it in batches
+        # instead of materializing the whole list and its JSON encoding at once.
+        return StreamingResponse(
+            _stream_all_candles(inst_id, bar, normalized, source, end_ts),
+            media_type="application/json",
+        )
+    payload = await run_in_threadpool(
+        _load_candles, inst_id, bar, normalized, limit, source, since_ts, end_ts
+    )
+    # Returning the response directly skips jsonable_encoder's pure-Python walk over
+    # thousands of candle dicts; orjson encodes them in one C pass.
+    return ORJSONResponse(payload)
+
+
+def _load_candles(
+    inst_id: str,
+    bar: str,
+    normalized: str,
+    limit: Optional[int],
+    source: str,
+    since_ts: Optional[int],
+    end_ts: Optional[int],
 ) -> dict:
-    if source not in VALID_SOURCES:
-        raise HTTPException(status_code=400, detail="Unsupported data source")
     if source == BINANCE_SPOT_SOURCE:
-        normalized = BINANCE_BARS.get(bar)
-        if normalized is None:
-            raise HTTPException(status_code=400, detail="Unsupported bar interval")
         resolved_limit = min(limit or 500, 1000)
-        if all_data:
-            _backfill_binance_history(inst_id, normalized)
-            candles = store.fetch_candles(BINANCE_SPOT_SOURCE, inst_id, normalized, limit=None)
-            payload = [_to_kline_payload(candle) for candle in candles]
-        else:
-            start_time = since_ts + 1 if since_ts is not None else None
-            _store_binance_klines(
+        start_time = since_ts + 1 if since_ts is not None else None
+        if end_ts is not None or not _refreshed_recently(inst_id, normalized):
+            _binance_fetches.do(
+                (BINANCE_SPOT_SOURCE, inst_id, normalized, resolved_limit, start_time, end_ts),
+                _store_binance_klines,
                 inst_id=inst_id,
                 bar=normalized,
                 limit=resolved_limit,
                 start_time=start_time,
                 end_time=end_ts,
             )
-            candles = store.fetch_candles(
-                BINANCE_SPOT_SOURCE,
-                inst_id,
-                normalized,
-                limit=resolved_limit,
-                start_ts=start_time,
-                end_ts=end_ts,
-            )
-            payload = [_to_kline_payload(candle) for candle in candles]
+            if end_ts is None:
+                _LAST_BINANCE_REFRESH[(inst_id, normalized)] = time.monotonic()
+        candles = store.fetch_candle_columns(
+            BINANCE_SPOT_SOURCE,
+            inst_id,
+            normalized,
+            limit=resolved_limit,
+            start_ts=start_time,
+            end_ts=end_ts,
+        )
+        payload = _to_kline_payload(candles)
         return {
             "instId": inst_id,
             "bar": bar,
@@ -145,17 +250,11 @@ def get_candles(
             "data": payload,
             "source": source,
         }
-    normalized = SUPPORTED_BARS.get(bar)
-    if normalized is None:
-        raise HTTPException(status_code=400, detail="Unsupported bar interval")
-    resolved_limit = None if all_data else limit
-    start_ts = None
-    if since_ts is not None and not all_data:
-        start_ts = since_ts + 1
-    candles = store.fetch_candles(
-        "okx", inst_id, normalized, limit=resolved_limit, start_ts=start_ts, end_ts=end_ts
+    start_ts = since_ts + 1 if since_ts is not None else None
+    candles = store.fetch_candle_columns(
+        "okx", inst_id, normalized, limit=limit, start_ts=start_ts, end_ts=end_ts
     )
-    payload = [_to_kline_payload(candle) for candle in candles]
+    payload = _to_kline_payload(candles)
     return {
         "instId": inst_id,
         "bar": bar,
@@ -166,18 +265,37 @@ def get_candles(
 
 
 @app.get("/api/ticker")
-def get_ticker(
-    inst_id: str = Query(DEFAULT_INST_ID, description="Instrument ID"),
+async def get_ticker(
+    inst_id: str = Query(SETTINGS.inst_id, description="Instrument ID"),
     source: str = Query("okx", description="Data source (okx/binance)"),
 ) -> dict:
     if source not in VALID_SOURCES:
         raise HTTPException(status_code=400, detail="Unsupported data source")
+    return await run_in_threadpool(_fetch_ticker, inst_id, source)
+
+
+def _fetch_ticker(inst_id: str, source: str) -> dict:
+    # Tickers barely move within the TTL, so polling clients share one upstream call.
+    key = (source, inst_id)
+    cached = _TICKER_CACHE.get(key)
+    if cached is not None and time.monotonic() - cached[0] < TICKER_CACHE_TTL_SECONDS:
+        return cached[1]
+    return _ticker_fetches.do(key, _fetch_ticker_uncached, inst_id, source)
+
+
+def _fetch_ticker_uncached(inst_id: str, source: str) -> dict:
+    payload = _request_ticker(inst_id, source)
+    _TICKER_CACHE[(source, inst_id)] = (time.monotonic(), payload)
+    return payload
+
+
+def _request_ticker(inst_id: str, source: str) -> dict:
     try:
         if source == BINANCE_SPOT_SOURCE:
             ticker = binance_client.get_ticker(inst_id)
             if not ticker:
                 raise HTTPException(status_code=502, detail="Ticker data unavailable")
-            ts_ms = int(time.time() * 1000)
+            ts_ms = time.time_ns() // 1_000_000
             return {
                 "instId": inst_id,
                 "last": ticker.get("price"),
@@ -201,13 +319,17 @@ def get_ticker(
 
 
 @app.get("/api/orderbook")
-def get_orderbook(
-    inst_id: str = Query(DEFAULT_INST_ID, description="Instrument ID"),
+async def get_orderbook(
+    inst_id: str = Query(SETTINGS.inst_id, description="Instrument ID"),
     depth: int = Query(1000, ge=1, le=1000),
     source: str = Query("okx", description="Data source (okx/binance)"),
 ) -> dict:
     if source not in VALID_SOURCES:
         raise HTTPException(status_code=400, detail="Unsupported data source")
+    return await run_in_threadpool(_fetch_orderbook, inst_id, depth, source)
+
+
+def _fetch_orderbook(inst_id: str, depth: int, source: str) -> dict:
     resolved_depth = depth
     if source == BINANCE_SPOT_SOURCE:
         book = binance_client.get_order_book(inst_id, limit=depth)
@@ -217,7 +339,7 @@ def get_orderbook(
     if not book:
         raise HTTPException(status_code=502, detail="Order book data unavailable")
     ts_value = book.get("ts")
-    ts_ms = int(ts_value) if ts_value is not None else int(time.time() * 1000)
+    ts_ms = int(ts_value) if ts_value is not None else time.time_ns() // 1_000_000
     try:
         store.upsert_orderbook_snapshot(
             inst_id=inst_id,
@@ -238,23 +360,96 @@ def get_orderbook(
 
 
 @app.get("/api/orderbook/history")
-def get_orderbook_history(
-    inst_id: str = Query(DEFAULT_INST_ID, description="Instrument ID"),
+async def get_orderbook_history(
+    inst_id: str = Query(SETTINGS.inst_id, description="Instrument ID"),
     start_ts: Optional[int] = Query(None, description="Start timestamp in milliseconds"),
     end_ts: Optional[int] = Query(None, description="End timestamp in milliseconds"),
     limit: int = Query(5000, ge=1, le=10000),
-) -> dict:
-    snapshots = store.fetch_orderbook_snapshots(
+) -> ORJSONResponse:
+    snapshots = await run_in_threadpool(
+        store.fetch_orderbook_snapshots,
         inst_id=inst_id,
         start_ts=start_ts,
         end_ts=end_ts,
         limit=limit,
     )
-    return {
-        "instId": inst_id,
-        "count": len(snapshots),
-        "data": snapshots,
-    }
+    return ORJSONResponse(
+        {
+            "instId": inst_id,
+            "count": len(snapshots),
+            "data": snapshots,
+        }
+    )
+
+
+class _SingleFlight:
+    """Collapse concurrent calls with the same key into one in-flight call.
+
+    The first caller runs ``fn``; callers arriving while it is still running wait
+    for it and get the same result (or exception) instead of repeating the fetch.
+    """
+
+    class _Call:
+        __slots__ = ("done", "result", "error")
+
+        def __init__(self) -> None:
+            self.done = threading.Event()
+            self.result: Any = None
+            self.error: Optional[BaseException] = None
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, "_SingleFlight._Call"] = {}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+# Binance fetches are keyed by (source, inst_id, bar, ...) so a burst of identical
+# requests triggers a single upstream fetch loop.
+_binance_fetches = _SingleFlight()
+_ticker_fetches = _SingleFlight()
+# (source, inst_id) -> (monotonic fetch time, response payload)
+_TICKER_CACHE: Dict[tuple[str, str], tuple[float, dict]] = {}
+# (inst_id, bar) -> monotonic time the latest Binance klines were last pulled.
+_LAST_BINANCE_REFRESH: Dict[tuple[str, str], float] = {}
+
+
+def _refreshed_recently(inst_id: str, bar: str) -> bool:
+    """Whether a chart poll can be served from the store without another upstream call."""
+
+    last = _LAST_BINANCE_REFRESH.get((inst_id, bar))
+    return last is not None and time.monotonic() - last < BINANCE_REFRESH_MIN_INTERVAL_SECONDS
+
+
+def _resolve_bar(source: str, bar: str) -> str:
+    """Map a requested (source, bar) to the stored bar, or raise a 400."""
+
+    normalized = RESOLVED_BARS.get((source, bar))
+    if normalized is None:
+        if source not in VALID_SOURCES:
+            raise HTTPException(status_code=400, detail="Unsupported data source")
+        raise HTTPException(status_code=400, detail="Unsupported bar interval")
+    return normalized
 
 
 def _store_binance_klines(
@@ -264,6 +459,7 @@ def _store_binance_klines(
     start_time: Optional[int] = None,
     end_time: Optional[int] = None,
 ) -> int:
+    binance_limiter.acquire()
     klines = binance_client.get_klines(
         symbol=inst_id,
         interval=bar,
@@ -273,45 +469,58 @@ def _store_binance_klines(
     )
     if not klines:
         return 0
-    candles = [
-        CandleStick(
-            source=BINANCE_SPOT_SOURCE,
-            inst_id=inst_id,
-            bar=bar,
-            ts=int(row[0]),
-            open=float(row[1]),
-            high=float(row[2]),
-            low=float(row[3]),
-            close=float(row[4]),
-            volume=float(row[5]),
-            volume_ccy=float(row[7]) if len(row) > 7 else 0.0,
-            volume_quote=float(row[7]) if len(row) > 7 else 0.0,
-            confirm=True,
-        )
-        for row in klines
-    ]
+    candles = parse_kline_columns(inst_id, bar, klines)
     store.upsert_candles(candles)
     return len(candles)
 
 
 def _backfill_binance_history(inst_id: str, bar: str) -> None:
     interval_ms = _binance_interval_ms(bar)
-    now_ms = int(time.time() * 1000)
+    now_ms = time.time_ns() // 1_000_000
     cutoff_ms = now_ms - (90 * 24 * 60 * 60 * 1000)
-    end_time = now_ms
-    while end_time >= cutoff_ms:
-        fetched = _store_binance_klines(
-            inst_id=inst_id,
-            bar=bar,
-            limit=1000,
+    # Each request covers BINANCE_KLINES_MAX_LIMIT candles ending at its end_time, so the
+    # windows are known upfront and several can be in flight instead of one at a time.
+    window_ms = BINANCE_KLINES_MAX_LIMIT * interval_ms
+    end_times = iter(range(now_ms, cutoff_ms - 1, -window_ms))
+
+    def fetch(end_time: int) -> list:
+        binance_limiter.acquire()
+        return binance_client.get_klines(
+            symbol=inst_id,
+            interval=bar,
+            limit=BINANCE_KLINES_MAX_LIMIT,
             end_time=end_time,
         )
-        if fetched == 0:
-            break
-        end_time -= fetched * interval_ms
+
+    with ThreadPoolExecutor(max_workers=BINANCE_BACKFILL_CONCURRENCY) as executor:
+        # Windows are submitted lazily, newest first, keeping a bounded number in flight.
+        in_flight = deque(
+            executor.submit(fetch, end_time)
+            for end_time in islice(end_times, BINANCE_BACKFILL_CONCURRENCY)
+        )
+        while in_flight:
+            klines = in_flight.popleft().result()
+            if not klines:
+                # The listing date has been passed: older windows have nothing either,
+                # so drop the queued ones and submit no more.
+                for future in in_flight:
+                    future.cancel()
+                break
+            # Writes stay on this thread.
+            store.upsert_candles(parse_kline_columns(inst_id, bar, klines))
+            next_end = next(end_times, None)
+            if next_end is not None:
+                in_flight.append(executor.submit(fetch, next_end))
 
 
 def _binance_interval_ms(interval: str) -> int:
+    interval_ms = _INTERVAL_MS.get(interval)
+    if interval_ms is None:
+        return _compute_interval_ms(interval)
+    return interval_ms
+
+
+def _compute_interval_ms(interval: str) -> int:
     unit = interval[-1]
     value = int(interval[:-1])
     if unit == "m":
@@ -327,12 +536,50 @@ def _binance_interval_ms(interval: str) -> int:
     raise ValueError(f"Unsupported interval: {interval}")
 
 
-def _to_kline_payload(candle: CandleStick) -> dict:
-    return {
-        "timestamp": candle.ts,
-        "open": candle.open,
-        "high": candle.high,
-        "low": candle.low,
-        "close": candle.close,
-        "volume": candle.volume,
-    }
+_INTERVAL_MS = {bar: _compute_interval_ms(bar) for bar in BINANCE_BARS.values()}
+
+
+def _stream_all_candles(
+    inst_id: str, bar: str, normalized: str, source: str, end_ts: Optional[int]
+) -> Iterator[bytes]:
+    """Encode the /api/candles payload for a whole series one batch at a time."""
+
+    # Same keys as the buffered response; count goes last since it is only known at the end.
+    header = orjson.dumps({"instId": inst_id, "bar": bar, "source": source})
+    yield header[:-1] + b',"data":['
+    count = 0
+    for rows in store.iter_candle_batches(source, inst_id, normalized, end_ts=end_ts):
+        chunk = orjson.dumps(
+            [
+                {
+                    "timestamp": ts,
+                    "open": open_,
+                    "high": high,
+                    "low": low,
+                    "close": close,
+                    "volume": volume,
+                }
+                for ts, open_, high, low, close, volume in rows
+            ]
+        )
+        # Strip each batch's brackets so the batches join into one JSON array.
+        yield (b"," if count else b"") + chunk[1:-1]
+        count += len(rows)
+    yield b'],"count":' + str(count).encode() + b"}"
+
+
+def _to_kline_payload(candles: CandleColumns) -> list[dict]:
+    # Walk the columns in lockstep; no per-candle objects or attribute lookups.
+    return [
+        {
+            "timestamp": ts,
+            "open": open_,
+            "high": high,
+            "low": low,
+            "close": close,
+            "volume": volume,
+        }
+        for ts, open_, high, low, close, volume in zip(
+            candles.ts, candles.open, candles.high, candles.low, candles.close, candles.volume
+        )
+    ]
@@ -2,18 +2,60 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
-import json
+from array import array
+from calendar import monthrange
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
 import logging
-from datetime import datetime, timedelta, timezone
-from typing import Iterable, List, Optional, Protocol, Sequence
+from operator import attrgetter
+from pathlib import Path
+import re
+from datetime import date, datetime, timezone
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Protocol,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+import queue
 import sqlite3
+import threading
+import time
 
+import orjson
 
-@dataclass(frozen=True)
+
+@dataclass
 class CandleStick:
     """Represents a single candlestick data point."""
 
+    # Declared by hand rather than slots=True so Python 3.9 stays supported. Not frozen:
+    # frozen dataclasses route every field through object.__setattr__ in __init__.
+    __slots__ = (
+        "source",
+        "inst_id",
+        "bar",
+        "ts",
+        "open",
+        "high",
+        "low",
+        "close",
+        "volume",
+        "volume_ccy",
+        "volume_quote",
+        "confirm",
+    )
+
     source: str
     inst_id: str
     bar: str
@@ -28,13 +70,113 @@ class CandleStick:
     confirm: bool
 
 
+@dataclass
+class CandleColumns:
+    """Column-oriented candle batch for one (source, inst_id, bar).
+
+    Each field is a typed ``array`` (8 bytes per value, 1 for ``confirm``), so
+    long histories do not keep one Python object per candle alive.
+    """
+
+    source: str
+    inst_id: str
+    bar: str
+    ts: array = field(default_factory=lambda: array("q"))
+    open: array = field(default_factory=lambda: array("d"))
+    high: array = field(default_factory=lambda: array("d"))
+    low: array = field(default_factory=lambda: array("d"))
+    close: array = field(default_factory=lambda: array("d"))
+    volume: array = field(default_factory=lambda: array("d"))
+    volume_ccy: array = field(default_factory=lambda: array("d"))
+    volume_quote: array = field(default_factory=lambda: array("d"))
+    confirm: array = field(default_factory=lambda: array("b"))
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def __getitem__(self, index: int) -> CandleStick:
+        return CandleStick(
+            self.source,
+            self.inst_id,
+            self.bar,
+            self.ts[index],
+            self.open[index],
+            self.high[index],
+            self.low[index],
+            self.close[index],
+            self.volume[index],
+            self.volume_ccy[index],
+            self.volume_quote[index],
+            bool(self.confirm[index]),
+        )
+
+    def __iter__(self) -> Iterator[CandleStick]:
+        for index in range(len(self.ts)):
+            yield self[index]
+
+    def extend(self, candles: Iterable[CandleStick]) -> None:
+        for candle in candles:
+            self.ts.append(candle.ts)
+            self.open.append(candle.open)
+            self.high.append(candle.high)
+            self.low.append(candle.low)
+            self.close.append(candle.close)
+            self.volume.append(candle.volume)
+            self.volume_ccy.append(candle.volume_ccy)
+            self.volume_quote.append(candle.volume_quote)
+            self.confirm.append(1 if candle.confirm else 0)
+
+    def extend_columns(self, other: "CandleColumns") -> None:
+        self.ts.extend(other.ts)
+        self.open.extend(other.open)
+        self.high.extend(other.high)
+        self.low.extend(other.low)
+        self.close.extend(other.close)
+        self.volume.extend(other.volume)
+        self.volume_ccy.extend(other.volume_ccy)
+        self.volume_quote.extend(other.volume_quote)
+        self.confirm.extend(other.confirm)
+
+    def to_candles(self) -> List[CandleStick]:
+        return list(self)
+
+    def rows(self) -> Iterator[Tuple[object, ...]]:
+        """Yield rows in the ``candles`` table column order."""
+
+        source, inst_id, bar = self.source, self.inst_id, self.bar
+        for values in zip(
+            self.ts,
+            self.open,
+            self.high,
+            self.low,
+            self.close,
+            self.volume,
+            self.volume_ccy,
+            self.volume_quote,
+            self.confirm,
+        ):
+            yield (source, inst_id, bar, *values)
+
+
+# (inst_id, ts_ms, bids, asks, depth) as accepted by upsert_orderbook_snapshots.
+OrderbookSnapshot = Tuple[
+    str, int, Sequence[Sequence[object]], Sequence[Sequence[object]], Optional[int]
+]
+
+
 class DatabaseBackend(Protocol):
     """Database interface for candle storage."""
 
     def initialize(self) -> None:
         """Initialize the database schema."""
 
-    def upsert_candles(self, candles: Sequence[CandleStick]) -> None:
+    def flush(self) -> None:
+        """Wait until any buffered writes have been committed."""
+
+    def close(self) -> None:
+        """Release any open connections."""
+
+    def upsert_candles(self, candles: Union[Sequence[CandleStick], CandleColumns]) -> None:
         """Upsert candlestick data into storage."""
 
     def fetch_existing_timestamps(
@@ -47,6 +189,11 @@ class DatabaseBackend(Protocol):
     ) -> List[int]:
         """Fetch timestamps already present for the given range."""
 
+    def missing_timestamps(
+        self, source: str, inst_id: str, bar: str, expected: Iterable[int]
+    ) -> List[int]:
+        """Return the expected timestamps that have no stored candle, ascending."""
+
     def latest_timestamp(self, source: str, inst_id: str, bar: str) -> Optional[int]:
         """Fetch the latest timestamp stored for the given instrument."""
 
@@ -61,9 +208,40 @@ class DatabaseBackend(Protocol):
     ) -> List[CandleStick]:
         """Fetch candlestick data for the given range."""
 
+    def fetch_candle_columns(
+        self,
+        source: str,
+        inst_id: str,
+        bar: str,
+        limit: Optional[int] = 300,
+        start_ts: Optional[int] = None,
+        end_ts: Optional[int] = None,
+    ) -> CandleColumns:
+        """Fetch candlestick data for the given range as compact columns."""
+
+    def iter_candle_batches(
+        self,
+        source: str,
+        inst_id: str,
+        bar: str,
+        end_ts: Optional[int] = None,
+        batch_size: int = 500,
+    ) -> Iterator[List[Tuple[int, float, float, float, float, float]]]:
+        """Yield every (ts, open, high, low, close, volume) row, oldest first, in batches."""
+
     def delete_older_than(self, cutoff_ts: int) -> int:
         """Delete data older than the given timestamp. Returns deleted rows."""
 
+    def fetch_complete_days(
+        self, source: str, inst_id: str, bar: str, start_ts: int
+    ) -> Set[int]:
+        """Fetch day starts (from start_ts on) already verified as having no gaps."""
+
+    def mark_days_complete(
+        self, source: str, inst_id: str, bar: str, day_starts: Iterable[int]
+    ) -> None:
+        """Record that the given days have no missing candles."""
+
     def upsert_orderbook_snapshot(
         self,
         inst_id: str,
@@ -74,6 +252,9 @@ class DatabaseBackend(Protocol):
     ) -> None:
         """Upsert order book snapshot data into storage."""
 
+    def upsert_orderbook_snapshots(self, snapshots: Iterable[OrderbookSnapshot]) -> None:
+        """Upsert many (inst_id, ts_ms, bids, asks, depth) snapshots in one transaction."""
+
     def fetch_orderbook_snapshots(
         self,
         inst_id: str,
@@ -94,21 +275,316 @@ class CacheBackend(Protocol):
         """Set a cached value with TTL."""
 
 
+# CandleStick -> row tuple in ``candles`` column order.
+_CANDLE_ROW = attrgetter(
+    "source",
+    "inst_id",
+    "bar",
+    "ts",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "volume_ccy",
+    "volume_quote",
+    "confirm",
+)
+# Writes only touch rows whose values changed, so re-fetched pages cost no I/O.
+_UPSERT_SQL = """
+INSERT INTO candles (
+    source, inst_id, bar, ts, open, high, low, close,
+    volume, volume_ccy, volume_quote, confirm
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(source, inst_id, bar, ts) DO UPDATE SET
+    open=excluded.open,
+    high=excluded.high,
+    low=excluded.low,
+    close=excluded.close,
+    volume=excluded.volume,
+    volume_ccy=excluded.volume_ccy,
+    volume_quote=excluded.volume_quote,
+    confirm=excluded.confirm
+WHERE (
+    candles.open, candles.high, candles.low, candles.close,
+    candles.volume, candles.volume_ccy, candles.volume_quote,
+    candles.confirm
+) IS NOT (
+    excluded.open, excluded.high, excluded.low, excluded.close,
+    excluded.volume, excluded.volume_ccy, excluded.volume_quote,
+    excluded.confirm
+)
+"""
+
+_ORDERBOOK_UPSERT_SQL = """
+INSERT INTO orderbook_snapshots (
+    inst_id, ts_sec, ts_ms, depth, bids, asks
+) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(inst_id, ts_sec) DO UPDATE SET
+    ts_ms=excluded.ts_ms,
+    depth=excluded.depth,
+    bids=excluded.bids,
+    asks=excluded.asks
+"""
+
+
+class _PendingWrite(NamedTuple):
+    """One executemany and the bookkeeping to run once it has committed."""
+
+    statement: str
+    rows: Iterable[Tuple[object, ...]]
+    after_commit: Optional[Callable[[], None]]
+
+
 @dataclass
 class SqliteCandleStore:
     """SQLite-backed candle storage implementation."""
 
     db_path: str = "candles.db"
     logger: logging.Logger = logging.getLogger(__name__)
+    # Page cache per connection (cache_size=-N KiB) and memory-mapped I/O window.
+    cache_size_kib: int = 65536
+    mmap_size: int = 268435456
+    # Rows removed per retention DELETE statement (and per commit).
+    delete_batch_size: int = 10000
+    # MAX(ts) per (source, inst_id, bar), kept current by this store's own writes.
+    # Other processes only ever add newer rows, so a stale entry errs low.
+    _latest: Dict[Tuple[str, str, str], int] = field(default_factory=dict, init=False, repr=False)
+    _latest_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    # Queue upserts for a background writer thread instead of committing inline.
+    background_writes: bool = False
+    # Queued writes the writer folds into one transaction per wakeup.
+    writer_batch_size: int = 64
+    # One long-lived connection shared by every method, serialized by _lock.
+    _conn: Optional[sqlite3.Connection] = field(default=None, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    _write_queue: "queue.Queue[Optional[_PendingWrite]]" = field(
+        default_factory=queue.Queue, init=False, repr=False
+    )
+    _writer: Optional[threading.Thread] = field(default=None, init=False, repr=False)
+    _writer_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    _writer_error: Optional[BaseException] = field(default=None, init=False, repr=False)
+    _writer_error_lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+    # Read-only connections the fetch methods borrow so reads never wait on _lock;
+    # 0 keeps every read on the shared connection. Needs a file-backed database.
+    read_pool_size: int = 0
+    _read_pool: "queue.LifoQueue[sqlite3.Connection]" = field(
+        default_factory=queue.LifoQueue, init=False, repr=False
+    )
+    _read_pool_open: int = field(default=0, init=False, repr=False)
+    _read_pool_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """Hold the shared connection; commits on success, rolls back on error."""
+
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect(check_same_thread=False)
+            with self._conn as connection:
+                yield connection
+
+    @contextmanager
+    def _read_connection(self) -> Iterator[sqlite3.Connection]:
+        """Like _connection, but first waits for queued writes so reads see them.
+
+        With a read pool, the connection is a pooled read-only one: under WAL it
+        reads the last committed snapshot while a writer holds the shared connection.
+        """
+
+        self._wait_for_writes()
+        if self.read_pool_size <= 0:
+            with self._connection() as connection:
+                yield connection
+            return
+        reader = self._borrow_reader()
+        try:
+            with reader as connection:
+                yield connection
+        finally:
+            self._read_pool.put(reader)
+
+    def _borrow_reader(self) -> sqlite3.Connection:
+        # Most recently returned first, so a small working set keeps its page cache warm.
+        try:
+            return self._read_pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._read_pool_lock:
+            if self._read_pool_open < self.read_pool_size:
+                reader = self._connect(check_same_thread=False, read_only=True)
+                self._read_pool_open += 1
+                return reader
+        return self._read_pool.get()
+
+    def _write(
+        self,
+        statement: str,
+        rows: Iterable[Tuple[object, ...]],
+        after_commit: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """Run an executemany in its own write transaction, inline or on the writer thread."""
+
+        if not self.background_writes:
+            self._commit_writes([_PendingWrite(statement, rows, after_commit)])
+            if after_commit is not None:
+                after_commit()
+            return
+        # An earlier queued write's failure is left for flush()/close(): raising it here
+        # would fail (and drop the rows of) an unrelated caller.
+        self._ensure_writer()
+        # The writer runs later, so copy the rows now: callers may reuse or clear the
+        # list or arrays they passed in as soon as this returns.
+        self._write_queue.put(_PendingWrite(statement, list(rows), after_commit))
+
+    def _commit_writes(self, writes: Sequence[_PendingWrite]) -> None:
+        with self._connection() as connection:
+            # Take the write lock up front so the batch never fails on a lock upgrade;
+            # the context manager commits, or rolls back if executemany raises.
+            connection.execute("BEGIN IMMEDIATE")
+            for write in writes:
+                connection.executemany(write.statement, write.rows)
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._run_writer, name=f"sqlite-writer:{self.db_path}", daemon=True
+                )
+                self._writer.start()
+
+    def _run_writer(self) -> None:
+        while True:
+            # Block for one write, then fold whatever else is already queued into the
+            # same transaction so bursts of small upserts share one commit.
+            batch = [self._write_queue.get()]
+            while len(batch) < self.writer_batch_size:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            writes = [write for write in batch if write is not None]
+            try:
+                if writes:
+                    self._commit_writes_isolating_failures(writes)
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+            if len(writes) < len(batch):
+                return
+
+    def _commit_writes_isolating_failures(self, writes: Sequence[_PendingWrite]) -> None:
+        try:
+            self._commit_writes(writes)
+        except Exception as exc:  # noqa: BLE001 - surfaced on flush() or close()
+            if len(writes) == 1:
+                self.logger.exception("Background write failed")
+                self._record_writer_error(exc)
+                return
+            # The shared transaction was rolled back; retry each write on its own so
+            # one bad batch does not discard the others queued alongside it.
+            for write in writes:
+                self._commit_writes_isolating_failures([write])
+            return
+        # Outside the try: the batch is committed, so a failing callback must not
+        # trigger the per-write retry (and run the other callbacks twice).
+        for write in writes:
+            if write.after_commit is None:
+                continue
+            try:
+                write.after_commit()
+            except Exception as exc:  # noqa: BLE001 - surfaced on flush() or close()
+                self.logger.exception("Background write callback failed")
+                self._record_writer_error(exc)
 
-    def _connect(self) -> sqlite3.Connection:
-        connection = sqlite3.connect(self.db_path)
-        connection.execute("PRAGMA journal_mode=WAL")
+    def flush(self) -> None:
+        """Wait until queued background writes are committed; re-raise a failed one."""
+
+        self._wait_for_writes()
+        self._raise_writer_error()
+
+    def _wait_for_writes(self) -> None:
+        # Reads only wait: a failed write belongs to the writer, not to the next reader.
+        if self._writer is not None:
+            self._write_queue.join()
+
+    def _record_writer_error(self, error: BaseException) -> None:
+        # Keep the first failure; later ones are already logged.
+        with self._writer_error_lock:
+            if self._writer_error is None:
+                self._writer_error = error
+
+    def _raise_writer_error(self) -> None:
+        with self._writer_error_lock:
+            error, self._writer_error = self._writer_error, None
+        if error is not None:
+            raise error
+
+    def close(self) -> None:
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._write_queue.put(None)
+            writer.join()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        with self._read_pool_lock:
+            while True:
+                try:
+                    self._read_pool.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._read_pool_open = 0
+        self._raise_writer_error()
+
+    def _connect(
+        self, check_same_thread: bool = True, read_only: bool = False
+    ) -> sqlite3.Connection:
+        # Autocommit mode: transactions are opened explicitly where batching matters.
+        # The shared connection reuses every statement the store issues; keep them all
+        # compiled (each distinct _candle_range_sql shape counts as one).
+        # Readers open the file with mode=ro; cache=shared is left out because a shared
+        # cache serializes its connections on table locks, which is what WAL avoids.
+        database = self.db_path
+        if read_only:
+            database = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+        connection = sqlite3.connect(
+            database,
+            isolation_level=None,
+            check_same_thread=check_same_thread,
+            cached_statements=256,
+            uri=read_only,
+        )
+        # Per-connection settings; journal_mode=WAL persists in the file (see initialize).
         connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA temp_store=MEMORY")
+        connection.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        connection.execute(f"PRAGMA cache_size=-{int(self.cache_size_kib)}")
         return connection
 
+    def _prepare_new_database(self) -> None:
+        """Apply page-level settings, which only take effect before the first write."""
+
+        connection = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            if connection.execute("PRAGMA page_count").fetchone()[0] == 0:
+                connection.execute("PRAGMA page_size=8192")
+                connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                connection.execute("VACUUM")
+        finally:
+            connection.close()
+
     def initialize(self) -> None:
-        with self._connect() as connection:
+        self._prepare_new_database()
+        with self._connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("BEGIN")
             self._migrate_schema(connection)
             connection.execute(
                 """
@@ -148,58 +624,55 @@ class SqliteCandleStore:
             connection.execute(
                 "CREATE INDEX IF NOT EXISTS idx_orderbook_ts ON orderbook_snapshots(ts_sec)"
             )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS meta_complete (
+                    source TEXT NOT NULL,
+                    inst_id TEXT NOT NULL,
+                    bar TEXT NOT NULL,
+                    day_start INTEGER NOT NULL,
+                    PRIMARY KEY (source, inst_id, bar, day_start)
+                ) WITHOUT ROWID
+                """
+            )
 
-    def upsert_candles(self, candles: Sequence[CandleStick]) -> None:
+    def upsert_candles(self, candles: Union[Sequence[CandleStick], CandleColumns]) -> None:
         if not candles:
             return
         source = candles[0].source
         inst_id = candles[0].inst_id
         bar = candles[0].bar
         latest_ts = candles[-1].ts
-        rows = [
-            (
-                candle.source,
-                candle.inst_id,
-                candle.bar,
-                candle.ts,
-                candle.open,
-                candle.high,
-                candle.low,
-                candle.close,
-                candle.volume,
-                candle.volume_ccy,
-                candle.volume_quote,
-                1 if candle.confirm else 0,
-            )
-            for candle in candles
-        ]
-        with self._connect() as connection:
-            connection.executemany(
-                """
-                INSERT INTO candles (
-                    source, inst_id, bar, ts, open, high, low, close,
-                    volume, volume_ccy, volume_quote, confirm
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(source, inst_id, bar, ts) DO UPDATE SET
-                    open=excluded.open,
-                    high=excluded.high,
-                    low=excluded.low,
-                    close=excluded.close,
-                    volume=excluded.volume,
-                    volume_ccy=excluded.volume_ccy,
-                    volume_quote=excluded.volume_quote,
-                    confirm=excluded.confirm
-                """,
-                rows,
+        batch_latest: Dict[Tuple[str, str, str], int] = {}
+        if isinstance(candles, CandleColumns):
+            rows: Iterable[Tuple[object, ...]] = candles.rows()
+            batch_latest[(source, inst_id, bar)] = max(candles.ts)
+        else:
+            for candle in candles:
+                key = (candle.source, candle.inst_id, candle.bar)
+                if candle.ts > batch_latest.get(key, -1):
+                    batch_latest[key] = candle.ts
+            # One C-level attrgetter call per candle, consumed lazily by executemany;
+            # bools bind as SQLite's 0/1 integers as-is.
+            rows = map(_CANDLE_ROW, candles)
+        count = len(candles)
+
+        def after_commit() -> None:
+            with self._latest_lock:
+                for key, ts in batch_latest.items():
+                    # Unknown keys stay uncached: the table may already hold newer rows.
+                    if key in self._latest and ts > self._latest[key]:
+                        self._latest[key] = ts
+            self.logger.info(
+                "Upserted %s candles for %s:%s (%s), latest ts=%s",
+                count,
+                source,
+                inst_id,
+                bar,
+                latest_ts,
             )
-        self.logger.info(
-            "Upserted %s candles for %s:%s (%s), latest ts=%s",
-            len(candles),
-            source,
-            inst_id,
-            bar,
-            latest_ts,
-        )
+
+        self._write(_UPSERT_SQL, rows, after_commit)
 
     def fetch_existing_timestamps(
         self,
@@ -209,7 +682,7 @@ class SqliteCandleStore:
         start_ts: int,
         end_ts: int,
     ) -> List[int]:
-        with self._connect() as connection:
+        with self._read_connection() as connection:
             cursor = connection.execute(
                 """
                 SELECT ts FROM candles
@@ -220,8 +693,41 @@ class SqliteCandleStore:
             )
             return [row[0] for row in cursor.fetchall()]
 
+    def missing_timestamps(
+        self, source: str, inst_id: str, bar: str, expected: Iterable[int]
+    ) -> List[int]:
+        with self._read_connection() as connection:
+            # The candidates go into a per-connection temp table and SQLite computes the
+            # anti-join against the primary key, so no existing timestamps are returned.
+            connection.execute("BEGIN")
+            connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS expected_ts (ts INTEGER PRIMARY KEY)"
+            )
+            connection.execute("DELETE FROM expected_ts")
+            connection.executemany(
+                "INSERT OR IGNORE INTO expected_ts (ts) VALUES (?)",
+                ((ts,) for ts in expected),
+            )
+            cursor = connection.execute(
+                """
+                SELECT e.ts FROM expected_ts AS e
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM candles AS c
+                    WHERE c.source = ? AND c.inst_id = ? AND c.bar = ? AND c.ts = e.ts
+                )
+                ORDER BY e.ts
+                """,
+                (source, inst_id, bar),
+            )
+            return [row[0] for row in cursor.fetchall()]
+
     def latest_timestamp(self, source: str, inst_id: str, bar: str) -> Optional[int]:
-        with self._connect() as connection:
+        key = (source, inst_id, bar)
+        with self._latest_lock:
+            cached = self._latest.get(key)
+        if cached is not None:
+            return cached
+        with self._read_connection() as connection:
             cursor = connection.execute(
                 """
                 SELECT MAX(ts) FROM candles WHERE source = ? AND inst_id = ? AND bar = ?
@@ -229,7 +735,13 @@ class SqliteCandleStore:
                 (source, inst_id, bar),
             )
             value = cursor.fetchone()[0]
-            return int(value) if value is not None else None
+        if value is None:
+            return None
+        with self._latest_lock:
+            # A concurrent upsert may have cached a newer value meanwhile.
+            latest = max(int(value), self._latest.get(key, int(value)))
+            self._latest[key] = latest
+        return latest
 
     def fetch_candles(
         self,
@@ -240,53 +752,176 @@ class SqliteCandleStore:
         start_ts: Optional[int] = None,
         end_ts: Optional[int] = None,
     ) -> List[CandleStick]:
-        where_clauses = ["source = ?", "inst_id = ?", "bar = ?"]
+        rows = self._select_candles(
+            "source, inst_id, bar, ts, open, high, low, close, volume, "
+            "volume_ccy, volume_quote, confirm",
+            source,
+            inst_id,
+            bar,
+            limit,
+            start_ts,
+            end_ts,
+        )
+        # Rows come back oldest first in column order; build them positionally.
+        return [CandleStick(*row[:11], bool(row[11])) for row in rows]
+
+    def fetch_candle_columns(
+        self,
+        source: str,
+        inst_id: str,
+        bar: str,
+        limit: Optional[int] = 300,
+        start_ts: Optional[int] = None,
+        end_ts: Optional[int] = None,
+    ) -> CandleColumns:
+        rows = self._select_candles(
+            "ts, open, high, low, close, volume, volume_ccy, volume_quote, confirm",
+            source,
+            inst_id,
+            bar,
+            limit,
+            start_ts,
+            end_ts,
+        )
+        columns = CandleColumns(source, inst_id, bar)
+        if not rows:
+            return columns
+        ts, open_, high, low, close, volume, volume_ccy, volume_quote, confirm = zip(*rows)
+        columns.ts.extend(ts)
+        columns.open.extend(open_)
+        columns.high.extend(high)
+        columns.low.extend(low)
+        columns.close.extend(close)
+        columns.volume.extend(volume)
+        columns.volume_ccy.extend(volume_ccy)
+        columns.volume_quote.extend(volume_quote)
+        columns.confirm.extend(confirm)
+        return columns
+
+    def iter_candle_batches(
+        self,
+        source: str,
+        inst_id: str,
+        bar: str,
+        end_ts: Optional[int] = None,
+        batch_size: int = 500,
+    ) -> Iterator[List[Tuple[int, float, float, float, float, float]]]:
+        # Streams on a connection of its own: it stays open for the life of the generator
+        # (only one batch of rows is held in memory) without holding the shared lock.
+        # Consumers such as StreamingResponse resume the generator on whichever worker
+        # thread is free, so the connection must not be pinned to the opening thread;
+        # the generator itself never runs two steps at once.
+        query = (
+            "SELECT ts, open, high, low, close, volume FROM candles "
+            "WHERE source = ? AND inst_id = ? AND bar = ?"
+        )
+        params: list[object] = [source, inst_id, bar]
+        if end_ts is not None:
+            query += " AND ts <= ?"
+            params.append(end_ts)
+        self._wait_for_writes()
+        connection = self._connect(check_same_thread=False)
+        try:
+            cursor = connection.execute(f"{query} ORDER BY ts", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            connection.close()
+
+    def _select_candles(
+        self,
+        columns_sql: str,
+        source: str,
+        inst_id: str,
+        bar: str,
+        limit: Optional[int],
+        start_ts: Optional[int],
+        end_ts: Optional[int],
+    ) -> List[Tuple[object, ...]]:
+        """Run the range query shared by the candle fetchers, oldest rows first."""
+
         params: list[object] = [source, inst_id, bar]
         if start_ts is not None:
-            where_clauses.append("ts >= ?")
             params.append(start_ts)
         if end_ts is not None:
-            where_clauses.append("ts <= ?")
             params.append(end_ts)
-        where_sql = " AND ".join(where_clauses)
-        base_query = (
-            "SELECT source, inst_id, bar, ts, open, high, low, close, volume, "
-            "volume_ccy, volume_quote, confirm "
-            "FROM candles WHERE "
-            f"{where_sql} ORDER BY ts DESC"
-        )
         if limit is not None:
-            base_query = f"{base_query} LIMIT ?"
             params.append(limit)
-        with self._connect() as connection:
-            cursor = connection.execute(base_query, params)
-            rows = cursor.fetchall()
-        candles = [
-            CandleStick(
-                source=row[0],
-                inst_id=row[1],
-                bar=row[2],
-                ts=row[3],
-                open=row[4],
-                high=row[5],
-                low=row[6],
-                close=row[7],
-                volume=row[8],
-                volume_ccy=row[9],
-                volume_quote=row[10],
-                confirm=bool(row[11]),
-            )
-            for row in rows
-        ]
-        return list(reversed(candles))
+        query = _candle_range_sql(
+            columns_sql, start_ts is not None, end_ts is not None, limit is not None
+        )
+        with self._read_connection() as connection:
+            cursor = connection.execute(query, params)
+            return cursor.fetchall()
 
     def delete_older_than(self, cutoff_ts: int) -> int:
-        with self._connect() as connection:
+        # Only wait: an earlier write's failure is reported by flush(), not by retention.
+        self._wait_for_writes()
+        with self._connection() as connection:
+            sources = _distinct_sources(connection)
+        deleted = 0
+        for source in sources:
+            while True:
+                # Bounded chunks keep each commit (and the WAL it grows) small; the shared
+                # lock is released between chunks so foreground writes can interleave.
+                # Pinning the source makes each chunk a range seek on idx_candles_ts
+                # instead of a walk past every kept row of the sources before it.
+                with self._connection() as connection:
+                    cursor = connection.execute(
+                        """
+                        DELETE FROM candles WHERE rowid IN (
+                            SELECT rowid FROM candles WHERE source = ? AND ts < ? LIMIT ?
+                        )
+                        """,
+                        (source, cutoff_ts, self.delete_batch_size),
+                    )
+                    chunk = cursor.rowcount
+                    if chunk:
+                        connection.execute("PRAGMA wal_checkpoint(PASSIVE)")
+                deleted += chunk
+                if chunk < self.delete_batch_size:
+                    break
+        with self._connection() as connection:
+            if deleted:
+                with self._latest_lock:
+                    self._latest.clear()
+            # Days that lost candles must be checked (and backfilled) again.
+            connection.execute("DELETE FROM meta_complete WHERE day_start < ?", (cutoff_ts,))
+            if deleted:
+                # No-op unless the file was created with auto_vacuum=INCREMENTAL.
+                # executescript runs the pragma to completion; execute() frees one page.
+                connection.executescript("PRAGMA incremental_vacuum(1000)")
+        return deleted
+
+    def fetch_complete_days(
+        self, source: str, inst_id: str, bar: str, start_ts: int
+    ) -> Set[int]:
+        with self._read_connection() as connection:
             cursor = connection.execute(
-                "DELETE FROM candles WHERE ts < ?",
-                (cutoff_ts,),
+                """
+                SELECT day_start FROM meta_complete
+                WHERE source = ? AND inst_id = ? AND bar = ? AND day_start >= ?
+                """,
+                (source, inst_id, bar, start_ts),
             )
-            return cursor.rowcount
+            return {row[0] for row in cursor.fetchall()}
+
+    def mark_days_complete(
+        self, source: str, inst_id: str, bar: str, day_starts: Iterable[int]
+    ) -> None:
+        rows = [(source, inst_id, bar, day_start) for day_start in day_starts]
+        if not rows:
+            return
+        self._write(
+            """
+            INSERT OR IGNORE INTO meta_complete (source, inst_id, bar, day_start)
+            VALUES (?, ?, ?, ?)
+            """,
+            rows,
+        )
 
     def upsert_orderbook_snapshot(
         self,
@@ -296,29 +931,24 @@ class SqliteCandleStore:
         asks: Sequence[Sequence[object]],
         depth: Optional[int] = None,
     ) -> None:
-        ts_sec = int(ts_ms) // 1000
-        payload = (
-            inst_id,
-            ts_sec,
-            int(ts_ms),
-            depth,
-            json.dumps(bids, separators=(",", ":"), ensure_ascii=False),
-            json.dumps(asks, separators=(",", ":"), ensure_ascii=False),
-        )
-        with self._connect() as connection:
-            connection.execute(
-                """
-                INSERT INTO orderbook_snapshots (
-                    inst_id, ts_sec, ts_ms, depth, bids, asks
-                ) VALUES (?, ?, ?, ?, ?, ?)
-                ON CONFLICT(inst_id, ts_sec) DO UPDATE SET
-                    ts_ms=excluded.ts_ms,
-                    depth=excluded.depth,
-                    bids=excluded.bids,
-                    asks=excluded.asks
-                """,
-                payload,
+        self.upsert_orderbook_snapshots([(inst_id, ts_ms, bids, asks, depth)])
+
+    def upsert_orderbook_snapshots(self, snapshots: Iterable[OrderbookSnapshot]) -> None:
+        rows = [
+            (
+                inst_id,
+                int(ts_ms) // 1000,
+                int(ts_ms),
+                depth,
+                # Same compact UTF-8 JSON as before, encoded in C; stored as bytes.
+                orjson.dumps(bids),
+                orjson.dumps(asks),
             )
+            for inst_id, ts_ms, bids, asks, depth in snapshots
+        ]
+        if not rows:
+            return
+        self._write(_ORDERBOOK_UPSERT_SQL, rows)
 
     def fetch_orderbook_snapshots(
         self,
@@ -343,15 +973,15 @@ class SqliteCandleStore:
         if limit is not None:
             query = f"{query} LIMIT ?"
             params.append(int(limit))
-        with self._connect() as connection:
+        with self._read_connection() as connection:
             rows = connection.execute(query, params).fetchall()
         snapshots = []
         for row in rows:
             snapshots.append(
                 {
                     "ts": int(row[0]),
-                    "bids": json.loads(row[1]),
-                    "asks": json.loads(row[2]),
+                    "bids": orjson.loads(row[1]),
+                    "asks": orjson.loads(row[2]),
                 }
             )
         return snapshots
@@ -400,37 +1030,371 @@ class SqliteCandleStore:
         connection.execute("ALTER TABLE candles_v2 RENAME TO candles")
 
 
+@dataclass
+class ShardedCandleStore:
+    """Candle storage split into one SQLite file per (source, bar).
+
+    SQLite allows a single writer per database, so sharding lets writers for
+    different series commit in parallel. Each shard is a full SqliteCandleStore
+    with its own connection and lock; order book snapshots live in a separate file.
+    """
+
+    path_template: str = "candles_{source}_{bar}.db"
+    orderbook_path: str = "orderbook.db"
+    logger: logging.Logger = logging.getLogger(__name__)
+    background_writes: bool = False
+    read_pool_size: int = 0
+    _shards: Dict[Tuple[str, str], SqliteCandleStore] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _shards_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    _orderbook: Optional[SqliteCandleStore] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        # Shard discovery globs one directory, so the placeholders may only name files.
+        parent = str(Path(self.path_template).parent)
+        if "{source}" in parent or "{bar}" in parent:
+            raise ValueError(
+                "Shard placeholders {source}/{bar} are only supported in the file name: "
+                f"{self.path_template}"
+            )
+
+    def initialize(self) -> None:
+        self._orderbook = SqliteCandleStore(
+            self.orderbook_path,
+            logger=self.logger,
+            background_writes=self.background_writes,
+            read_pool_size=self.read_pool_size,
+        )
+        self._orderbook.initialize()
+        # Reopen shards written by earlier runs so retention still reaches them.
+        for source, bar in self._existing_shard_keys():
+            self._shard(source, bar)
+
+    def flush(self) -> None:
+        with self._shards_lock:
+            shards = list(self._shards.values())
+        for shard in shards:
+            shard.flush()
+        if self._orderbook is not None:
+            self._orderbook.flush()
+
+    def close(self) -> None:
+        with self._shards_lock:
+            shards = list(self._shards.values())
+            self._shards.clear()
+        if self._orderbook is not None:
+            shards.append(self._orderbook)
+        # Close every file even if one reports a failed background write; raise after.
+        errors = []
+        for shard in shards:
+            try:
+                shard.close()
+            except Exception as exc:  # noqa: BLE001 - re-raised once all are closed
+                errors.append(exc)
+        if errors:
+            raise errors[0]
+
+    def _shard_path(self, source: str, bar: str) -> str:
+        return self.path_template.format(source=source, bar=_shard_bar_name(bar))
+
+    def _shard(self, source: str, bar: str) -> SqliteCandleStore:
+        key = (source, bar)
+        shard = self._shards.get(key)
+        if shard is not None:
+            return shard
+        with self._shards_lock:
+            shard = self._shards.get(key)
+            if shard is None:
+                path = self._shard_path(source, bar)
+                shard = SqliteCandleStore(
+                    path,
+                    logger=self.logger,
+                    background_writes=self.background_writes,
+                    read_pool_size=self.read_pool_size,
+                )
+                shard.initialize()
+                self._shards[key] = shard
+        return shard
+
+    def _existing_shard(self, source: str, bar: str) -> Optional[SqliteCandleStore]:
+        """The shard for reads: opened if another process created its file, never created."""
+
+        shard = self._shards.get((source, bar))
+        if shard is None and Path(self._shard_path(source, bar)).exists():
+            shard = self._shard(source, bar)
+        return shard
+
+    def _existing_shard_keys(self) -> List[Tuple[str, str]]:
+        template = Path(self.path_template)
+        name_template = template.name
+        pattern = re.compile(
+            re.escape(name_template)
+            .replace(re.escape("{source}"), "(?P<source>[^/]+?)")
+            .replace(re.escape("{bar}"), "(?P<bar>[^/]+?)")
+            + "$"
+        )
+        keys = []
+        for path in template.parent.glob(name_template.format(source="*", bar="*")):
+            match = pattern.match(path.name)
+            if match:
+                keys.append((match.group("source"), _bar_from_shard_name(match.group("bar"))))
+        return keys
+
+    def upsert_candles(self, candles: Union[Sequence[CandleStick], CandleColumns]) -> None:
+        if not candles:
+            return
+        if isinstance(candles, CandleColumns):
+            self._shard(candles.source, candles.bar).upsert_candles(candles)
+            return
+        batches: Dict[Tuple[str, str], List[CandleStick]] = {}
+        for candle in candles:
+            batches.setdefault((candle.source, candle.bar), []).append(candle)
+        for (source, bar), batch in batches.items():
+            self._shard(source, bar).upsert_candles(batch)
+
+    def fetch_existing_timestamps(
+        self,
+        source: str,
+        inst_id: str,
+        bar: str,
+        start_ts: int,
+        end_ts: int,
+    ) -> List[int]:
+        shard = self._existing_shard(source, bar)
+        if shard is None:
+            return []
+        return shard.fetch_existing_timestamps(source, inst_id, bar, start_ts, end_ts)
+
+    def missing_timestamps(
+        self, source: str, inst_id: str, bar: str, expected: Iterable[int]
+    ) -> List[int]:
+        shard = self._existing_shard(source, bar)
+        if shard is None:
+            return sorted(set(expected))
+        return shard.missing_timestamps(source, inst_id, bar, expected)
+
+    def latest_timestamp(self, source: str, inst_id: str, bar: str) -> Optional[int]:
+        shard = self._existing_shard(source, bar)
+        if shard is None:
+            return None
+        return shard.latest_timestamp(source, inst_id, bar)
+
+    def fetch_candles(
+        self,
+        source: str,
+        inst_id: str,
+        bar: str,
+        limit: Optional[int] = 300,
+        start_ts: Optional[int] = None,
+        end_ts: Optional[int] = None,
+    ) -> List[CandleStick]:
+        shard = self._existing_shard(source, bar)
+        if shard is None:
+            return []
+        return shard.fetch_candles(
+            source, inst_id, bar, limit=limit, start_ts=start_ts, end_ts=end_ts
+        )
+
+    def fetch_candle_columns(
+        self,
+        source: str,
+        inst_id: str,
+        bar: str,
+        limit: Optional[int] = 300,
+        start_ts: Optional[int] = None,
+        end_ts: Optional[int] = None,
+    ) -> CandleColumns:
+        shard = self._existing_shard(source, bar)
+        if shard is None:
+            return CandleColumns(source, inst_id, bar)
+        return shard.fetch_candle_columns(
+            source, inst_id, bar, limit=limit, start_ts=start_ts, end_ts=end_ts
+        )
+
+    def iter_candle_batches(
+        self,
+        source: str,
+        inst_id: str,
+        bar: str,
+        end_ts: Optional[int] = None,
+        batch_size: int = 500,
+    ) -> Iterator[List[Tuple[int, float, float, float, float, float]]]:
+        shard = self._existing_shard(source, bar)
+        if shard is None:
+            return iter(())
+        return shard.iter_candle_batches(
+            source, inst_id, bar, end_ts=end_ts, batch_size=batch_size
+        )
+
+    def delete_older_than(self, cutoff_ts: int) -> int:
+        with self._shards_lock:
+            shards = list(self._shards.values())
+        if not shards:
+            return 0
+        # Each shard has its own writer, so the purges run side by side.
+        with ThreadPoolExecutor(max_workers=min(len(shards), 8)) as executor:
+            return sum(executor.map(lambda shard: shard.delete_older_than(cutoff_ts), shards))
+
+    def fetch_complete_days(
+        self, source: str, inst_id: str, bar: str, start_ts: int
+    ) -> Set[int]:
+        shard = self._existing_shard(source, bar)
+        if shard is None:
+            return set()
+        return shard.fetch_complete_days(source, inst_id, bar, start_ts)
+
+    def mark_days_complete(
+        self, source: str, inst_id: str, bar: str, day_starts: Iterable[int]
+    ) -> None:
+        day_starts = list(day_starts)
+        if day_starts:
+            self._shard(source, bar).mark_days_complete(source, inst_id, bar, day_starts)
+
+    def upsert_orderbook_snapshot(
+        self,
+        inst_id: str,
+        ts_ms: int,
+        bids: Sequence[Sequence[object]],
+        asks: Sequence[Sequence[object]],
+        depth: Optional[int] = None,
+    ) -> None:
+        self._orderbook_store().upsert_orderbook_snapshot(inst_id, ts_ms, bids, asks, depth)
+
+    def upsert_orderbook_snapshots(self, snapshots: Iterable[OrderbookSnapshot]) -> None:
+        self._orderbook_store().upsert_orderbook_snapshots(snapshots)
+
+    def fetch_orderbook_snapshots(
+        self,
+        inst_id: str,
+        start_ts: Optional[int] = None,
+        end_ts: Optional[int] = None,
+        limit: Optional[int] = 5000,
+    ) -> List[dict]:
+        return self._orderbook_store().fetch_orderbook_snapshots(
+            inst_id, start_ts=start_ts, end_ts=end_ts, limit=limit
+        )
+
+    def _orderbook_store(self) -> SqliteCandleStore:
+        if self._orderbook is None:
+            raise RuntimeError("ShardedCandleStore.initialize() must be called first")
+        return self._orderbook
+
+
+def _shard_bar_name(bar: str) -> str:
+    """File-name form of a bar that stays distinct on case-insensitive filesystems."""
+
+    # "1m" (minute) and "1M" (month) would otherwise name the same file on macOS/Windows.
+    return f"{bar[:-1]}Mo" if bar.endswith("M") else bar
+
+
+def _bar_from_shard_name(name: str) -> str:
+    return f"{name[:-2]}M" if name.endswith("Mo") else name
+
+
+def open_candle_store(
+    db_path: str, background_writes: bool = False, read_pool_size: int = 0
+) -> DatabaseBackend:
+    """Open a single-file store, or a sharded one when the file name has {source}/{bar}.
+
+    Raises ValueError when the placeholders appear in a directory part of the path.
+    """
+
+    if "{source}" in db_path or "{bar}" in db_path:
+        # ShardedCandleStore rejects placeholders outside the file name.
+        orderbook_path = str(Path(db_path).with_name("orderbook.db"))
+        return ShardedCandleStore(
+            db_path,
+            orderbook_path=orderbook_path,
+            background_writes=background_writes,
+            read_pool_size=read_pool_size,
+        )
+    return SqliteCandleStore(
+        db_path, background_writes=background_writes, read_pool_size=read_pool_size
+    )
+
+
+@lru_cache(maxsize=32)
+def _candle_range_sql(
+    columns_sql: str, has_start: bool, has_end: bool, has_limit: bool
+) -> str:
+    """Build the candle range query for one parameter shape.
+
+    Each shape maps to one SQL string, so the text is built once per process and
+    sqlite3's per-connection statement cache sees identical queries.
+    """
+
+    where_clauses = ["source = ?", "inst_id = ?", "bar = ?"]
+    if has_start:
+        where_clauses.append("ts >= ?")
+    if has_end:
+        where_clauses.append("ts <= ?")
+    where_sql = " AND ".join(where_clauses)
+    if not has_limit:
+        return f"SELECT {columns_sql} FROM candles WHERE {where_sql} ORDER BY ts"
+    # The newest N rows, handed back in ascending order so callers need no reversal pass.
+    return (
+        f"SELECT {columns_sql} FROM ("
+        f"SELECT {columns_sql} FROM candles WHERE {where_sql} ORDER BY ts DESC LIMIT ?"
+        ") ORDER BY ts"
+    )
+
+
+def _distinct_sources(connection: sqlite3.Connection) -> List[str]:
+    # Hop from one source to the next on idx_candles_ts: one index seek per source,
+    # where SELECT DISTINCT would read every entry of the index.
+    sources: List[str] = []
+    row = connection.execute("SELECT MIN(source) FROM candles").fetchone()
+    while row[0] is not None:
+        sources.append(row[0])
+        row = connection.execute(
+            "SELECT MIN(source) FROM candles WHERE source > ?", (row[0],)
+        ).fetchone()
+    return sources
+
+
 def subtract_months(reference: datetime, months: int) -> datetime:
     """Subtract a number of calendar months from a datetime."""
 
-    year = reference.year
-    month = reference.month - months
-    while month <= 0:
-        month += 12
-        year -= 1
-
-    day = min(reference.day, _days_in_month(year, month))
+    year, month_index = divmod(reference.year * 12 + reference.month - 1 - months, 12)
+    month = month_index + 1
+    day = min(reference.day, monthrange(year, month)[1])
     return reference.replace(year=year, month=month, day=day)
 
 
-def _days_in_month(year: int, month: int) -> int:
-    next_month = datetime(year, month, 28, tzinfo=timezone.utc) + timedelta(days=4)
-    last_day = next_month.replace(day=1) - timedelta(days=1)
-    return last_day.day
+_DAY_MS = 86_400_000
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+@lru_cache(maxsize=8)
+def _shifted_day_start_ms(epoch_day: int, months: int) -> int:
+    """UTC midnight, in milliseconds, of the day ``months`` months before ``epoch_day``."""
+
+    day = date.fromordinal(_EPOCH_ORDINAL + epoch_day)
+    midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    return int(subtract_months(midnight, months).timestamp()) * 1000
 
 
 def compute_retention_cutoff(months: int, now: Optional[datetime] = None) -> int:
     """Compute retention cutoff timestamp in milliseconds."""
 
-    now = now or datetime.now(timezone.utc)
+    if now is None:
+        # Month arithmetic only moves the date; the time of day carries over as-is,
+        # so the calendar work is cached per UTC day and the rest is integer math.
+        epoch_day, day_ms = divmod(time.time_ns() // 1_000_000, _DAY_MS)
+        return _shifted_day_start_ms(epoch_day, months) + day_ms
     cutoff = subtract_months(now, months)
     return int(cutoff.timestamp() * 1000)
 
 
 __all__ = [
     "CacheBackend",
+    "CandleColumns",
     "CandleStick",
     "DatabaseBackend",
+    "OrderbookSnapshot",
+    "ShardedCandleStore",
     "SqliteCandleStore",
     "compute_retention_cutoff",
+    "open_candle_store",
 ]
@@ -0,0 +1,7 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+# Collected before any test module, so every `import tauto` resolves against src/.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
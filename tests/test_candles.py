@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+from tauto.candles import CandlestickService, RateLimiter
+from tauto.okx import OkxClient
+from tauto.storage import CandleStick, SqliteCandleStore
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 100.0
+        self.sleeps: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_rate_limiter_allows_burst_then_spaces_calls() -> None:
+    clock = FakeClock()
+    with patch("time.monotonic", clock.monotonic), patch("time.sleep", clock.sleep):
+        limiter = RateLimiter(2.0)
+        for _ in range(4):
+            limiter.acquire()
+
+    assert clock.sleeps == [0.5, 0.5]
+
+
+def test_rate_limiter_idle_time_restores_capacity() -> None:
+    clock = FakeClock()
+    with patch("time.monotonic", clock.monotonic), patch("time.sleep", clock.sleep):
+        limiter = RateLimiter(1.0)
+        limiter.acquire()
+        clock.now += 10.0
+        limiter.acquire()
+        limiter.acquire()
+
+    assert clock.sleeps == [1.0]
+
+
+class RecordingClient(OkxClient):
+    def __post_init__(self) -> None:
+        super().__post_init__()
+        self.calls: list[dict[str, Any]] = []
+
+    def get_candlesticks(self, inst_id: str, **kwargs: Any) -> list[list[str]]:
+        self.calls.append(kwargs)
+        return []
+
+
+def test_backfill_missing_fetches_each_gap_once(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "candles.db"))
+    client = RecordingClient()
+    service = CandlestickService(client=client, store=store, bar="1m", history_qps=0)
+    service.initialize()
+    store.upsert_candles(
+        [
+            CandleStick("okx", "BTC-USDT", "1m", ts, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, True)
+            for ts in (0, 240_000)
+        ]
+    )
+
+    missing = service.backfill_missing("BTC-USDT", 0, 360_000)
+
+    assert missing == [60_000, 120_000, 180_000, 300_000, 360_000]
+    assert [call["after"] for call in client.calls] == ["180001", "360001"]
+
+
+class PagedClient(OkxClient):
+    def __post_init__(self) -> None:
+        super().__post_init__()
+        self.pages: list[list[list[str]]] = []
+
+    def get_candlesticks(self, inst_id: str, **kwargs: Any) -> list[list[str]]:
+        return self.pages.pop(0) if self.pages else []
+
+
+def _okx_row(ts: int, close: str = "1.5", confirm: str = "1") -> list[str]:
+    return [str(ts), "1", "2", "0.5", close, "10", "20", "30", confirm]
+
+
+def test_fetch_history_stores_only_rows_in_range(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "candles.db"))
+    client = PagedClient()
+    client.pages = [[_okx_row(240_000), _okx_row(180_000), _okx_row(120_000), _okx_row(60_000)]]
+    service = CandlestickService(client=client, store=store, bar="1m", history_qps=0)
+    service.initialize()
+
+    fetched = service.fetch_history("BTC-USDT", 100_000, 200_000)
+
+    assert list(fetched.ts) == [180_000, 120_000]
+    assert fetched[0] == CandleStick(
+        "okx", "BTC-USDT", "1m", 180_000, 1.0, 2.0, 0.5, 1.5, 10.0, 20.0, 30.0, True
+    )
+    assert store.fetch_existing_timestamps("okx", "BTC-USDT", "1m", 0, 300_000) == [
+        120_000,
+        180_000,
+    ]
+
+
+def test_fill_since_latest_uses_one_bounded_request_for_small_gaps(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "candles.db"))
+    client = PagedClient()
+    service = CandlestickService(client=client, store=store, bar="1m", history_qps=0)
+    service.initialize()
+    now_ts = int(time.time() * 1000)
+    latest = now_ts - (now_ts % 60_000) - 120_000
+    store.upsert_candles(service._parse_page_columns("BTC-USDT", [_okx_row(latest)]))
+    client.pages = [
+        [_okx_row(latest + 120_000, confirm="0"), _okx_row(latest + 60_000), _okx_row(latest)]
+    ]
+    calls: list[dict[str, Any]] = []
+    original = client.get_candlesticks
+
+    def recording_get(inst_id: str, **kwargs: Any) -> list[list[str]]:
+        calls.append(kwargs)
+        return original(inst_id, **kwargs)
+
+    client.get_candlesticks = recording_get  # type: ignore[method-assign]
+
+    assert service.fill_since_latest("BTC-USDT") == latest
+    assert len(calls) == 1
+    assert calls[0]["limit"] in (3, 4)
+    assert "use_history" not in calls[0]
+    assert store.latest_timestamp("okx", "BTC-USDT", "1m") == latest + 120_000
+
+
+def test_rate_limiter_hands_out_distinct_slots_across_threads() -> None:
+    clock = FakeClock()
+    sleeps: list[float] = []
+    with patch("time.monotonic", clock.monotonic), patch("time.sleep", sleeps.append):
+        limiter = RateLimiter(10.0)
+        threads = [threading.Thread(target=limiter.acquire) for _ in range(30)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert sorted(round(wait, 6) for wait in sleeps) == [
+        round(slot / 10, 6) for slot in range(1, 21)
+    ]
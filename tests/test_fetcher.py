@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from tauto.fetcher import (
+    BinanceBackfillService,
+    _backfill_day,
+    _build_missing_day_queue_multi,
+    _day_start_ts,
+    _expected_slots,
+    _find_missing_in_day,
+    _full_day_slots,
+    _parse_inst_priority,
+    _take_backfill_jobs,
+    _three_months_ago,
+)
+from tauto.storage import CandleStick, SqliteCandleStore
+
+HOUR_MS = 60 * 60 * 1000
+DAY_MS = 24 * HOUR_MS
+
+
+def _candle(ts: int) -> CandleStick:
+    return CandleStick(
+        source="okx",
+        inst_id="BTC-USDT",
+        bar="1H",
+        ts=ts,
+        open=1.0,
+        high=1.0,
+        low=1.0,
+        close=1.0,
+        volume=1.0,
+        volume_ccy=1.0,
+        volume_quote=1.0,
+        confirm=True,
+    )
+
+
+def test_find_missing_in_day_returns_sorted_gaps(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "candles.db"))
+    store.initialize()
+    day_start = 10 * DAY_MS
+    missing_hours = {3, 4, 17}
+    store.upsert_candles(
+        [_candle(day_start + hour * HOUR_MS) for hour in range(24) if hour not in missing_hours]
+    )
+
+    missing = _find_missing_in_day(
+        store, "okx", "BTC-USDT", "1H", day_start, day_start + DAY_MS - 1
+    )
+
+    assert missing == [day_start + hour * HOUR_MS for hour in sorted(missing_hours)]
+
+
+def test_missing_day_queue_lists_only_incomplete_days(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "candles.db"))
+    store.initialize()
+    now_ts = 200 * DAY_MS + 6 * HOUR_MS
+    window_start = _day_start_ts(_three_months_ago(now_ts))
+    gap_day = 150 * DAY_MS
+    store.upsert_candles(
+        [
+            _candle(ts)
+            for ts in range(window_start, now_ts + 1, HOUR_MS)
+            if ts != gap_day + 5 * HOUR_MS
+        ]
+    )
+
+    queue = _build_missing_day_queue_multi(
+        store, {"okx": (["BTC-USDT"], {"1H": object()})}, now_ts
+    )
+
+    assert queue == [(-gap_day, 0, "okx", "BTC-USDT", gap_day + DAY_MS - 1)]
+    complete = store.fetch_complete_days("okx", "BTC-USDT", "1H", window_start)
+    assert gap_day not in complete
+    assert _day_start_ts(now_ts) not in complete
+    assert len(complete) == (_day_start_ts(now_ts) - window_start) // DAY_MS - 1
+
+
+class RecordingService:
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, int, int]] = []
+
+    def fetch_history(self, inst_id: str, start_ts: int, end_ts: int) -> list[CandleStick]:
+        self.calls.append((inst_id, start_ts, end_ts))
+        return []
+
+
+def test_backfill_queue_fetches_each_incomplete_series_on_the_pool(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "candles.db"))
+    store.initialize()
+    day_start = 10 * DAY_MS
+    day_end = day_start + DAY_MS - 1
+    store.upsert_candles([_candle(day_start + hour * HOUR_MS) for hour in range(24)])
+    service = RecordingService()
+    queue = [(-day_start, 0, "okx", "ETH-USDT", day_end)]
+
+    jobs = _take_backfill_jobs(
+        queue, {"okx": (["BTC-USDT", "ETH-USDT"], {"1H": service})}, store, days_per_cycle=1
+    )
+    # Same fan-out as run_fetcher: one _backfill_day per job on the shared pool.
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for future in [executor.submit(_backfill_day, store, *job) for job in jobs]:
+            future.result()
+
+    assert not queue
+    assert service.calls == [("ETH-USDT", day_start, day_end)]
+
+
+class KlineClient:
+    def __init__(self, klines: list[list]) -> None:
+        self.klines = klines
+        self.calls: list[dict[str, object]] = []
+
+    def get_klines(self, **kwargs: object) -> list[list]:
+        self.calls.append(kwargs)
+        start, end, limit = kwargs["start_time"], kwargs["end_time"], kwargs["limit"]
+        return [row for row in self.klines if start <= row[0] <= end][:limit]
+
+
+def test_binance_backfill_stores_parsed_columns(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "candles.db"))
+    store.initialize()
+    klines = [
+        [ts, "1", "2", "0.5", "1.5", "10", ts + HOUR_MS - 1, "15", 3, "4", "6", "0"]
+        for ts in (0, HOUR_MS, 2 * HOUR_MS)
+    ]
+    service = BinanceBackfillService(KlineClient(klines), store, "1h")  # type: ignore[arg-type]
+
+    fetched = service.fetch_history("BTCUSDT", HOUR_MS, 2 * HOUR_MS)
+
+    assert list(fetched.ts) == [HOUR_MS, 2 * HOUR_MS]
+    stored = store.fetch_candles("binance", "BTCUSDT", "1h", limit=None)
+    assert stored == fetched.to_candles()
+    assert stored[0].close == 1.5
+    assert stored[0].volume_quote == 15.0
+    assert stored[0].confirm is True
+
+
+def test_binance_backfill_pages_forward_until_a_short_page(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "candles.db"))
+    store.initialize()
+    minute = 60_000
+    klines = [
+        [ts, "1", "1", "1", "1", "1", ts + minute - 1, "1", 1, "1", "1", "0"]
+        for ts in range(0, 1440 * minute, minute)
+    ]
+    client = KlineClient(klines)
+    service = BinanceBackfillService(client, store, "1m")  # type: ignore[arg-type]
+
+    fetched = service.fetch_history("BTCUSDT", 0, DAY_MS - 1)
+
+    assert len(fetched) == 1440
+    assert [call["start_time"] for call in client.calls] == [0, 999 * minute + 1]
+
+
+def test_missing_day_queue_orders_by_day_then_priority(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "candles.db"))
+    store.initialize()
+    now_ts = 200 * DAY_MS + 6 * HOUR_MS
+
+    queue = _build_missing_day_queue_multi(
+        store,
+        {"okx": (["BTC-USDT", "ETH-USDT"], {"1H": object()})},
+        now_ts,
+        priorities={"ETH-USDT": 5},
+    )
+    popped = [heapq.heappop(queue) for _ in range(4)]
+
+    assert [(entry[3], -entry[0]) for entry in popped] == [
+        ("ETH-USDT", 200 * DAY_MS),
+        ("BTC-USDT", 200 * DAY_MS),
+        ("ETH-USDT", 199 * DAY_MS),
+        ("BTC-USDT", 199 * DAY_MS),
+    ]
+
+
+def test_parse_inst_priority_skips_malformed_entries(caplog) -> None:
+    with caplog.at_level(logging.WARNING, logger="tauto.fetcher"):
+        priorities = _parse_inst_priority(" BTC-USDT=2, ETH-USDT ,SOL-USDT=high,,=3, DOGE-USDT=-1")
+
+    assert priorities == {"BTC-USDT": 2, "DOGE-USDT": -1}
+    assert [record.args[0] for record in caplog.records] == ["ETH-USDT", "SOL-USDT=high", "=3"]
+
+
+def test_expected_slots_caches_only_full_days() -> None:
+    day_start = 30 * DAY_MS
+    _full_day_slots.cache_clear()
+
+    for now_ts in range(day_start + HOUR_MS, day_start + 6 * HOUR_MS, HOUR_MS):
+        assert max(_expected_slots("okx", "1H", day_start, now_ts)) == now_ts
+    assert _full_day_slots.cache_info().currsize == 0
+
+    full_day = _expected_slots("okx", "1H", day_start, day_start + DAY_MS - 1)
+    assert len(full_day) == 24
+    assert _expected_slots("okx", "1H", day_start, day_start + DAY_MS - 1) is full_day
+    assert _full_day_slots.cache_info().currsize == 1
@@ -1,114 +1,231 @@
 from __future__ import annotations
 
-import sys
-from pathlib import Path
-from typing import Any
-from unittest.mock import MagicMock, patch
+import json
+from typing import Any, Dict, Iterator, NamedTuple, Optional
+from urllib.parse import parse_qsl, urlsplit
 
 import pytest
 import requests
+from requests.adapters import BaseAdapter
 
-ROOT = Path(__file__).resolve().parents[1]
-sys.path.insert(0, str(ROOT / "src"))
+from tauto.okx import OkxApiError, OkxClient
 
-from tauto.okx import OkxApiError, OkxClient  # noqa: E402
+INSTRUMENTS = "/api/v5/public/instruments"
 
 
-class DummyResponse:
-    def __init__(self, payload: dict[str, Any], status_code: int = 200) -> None:
-        self._payload = payload
-        self.status_code = status_code
+class Reply(NamedTuple):
+    """A canned HTTP response; turned into a fresh requests.Response per request."""
 
-    def raise_for_status(self) -> None:
-        if self.status_code >= 400:
-            raise requests.HTTPError("bad response")
-
-    def json(self) -> dict[str, Any]:
-        return self._payload
-
-
-def test_list_instruments() -> None:
-    response = DummyResponse({"code": "0", "data": [{"instId": "BTC-USDT"}]})
-
-    with patch("requests.get", return_value=response) as mock_get:
-        client = OkxClient()
-        instruments = client.list_instruments("SPOT")
-
-    assert instruments == [{"instId": "BTC-USDT"}]
-    mock_get.assert_called_once_with(
-        "https://www.okx.com/api/v5/public/instruments",
-        params={"instType": "SPOT"},
-        timeout=client.timeout,
-    )
-
-
-def test_get_order_book() -> None:
-    response = DummyResponse({"code": "0", "data": [{"bids": [["1", "2"]]}]})
-
-    with patch("requests.get", return_value=response):
-        client = OkxClient()
-        order_book = client.get_order_book("BTC-USDT", depth=10)
-
-    assert order_book == {"bids": [["1", "2"]]}
-
-
-def test_get_trades() -> None:
-    response = DummyResponse({"code": "0", "data": [{"tradeId": "1"}]})
-
-    with patch("requests.get", return_value=response):
-        client = OkxClient()
-        trades = client.get_trades("BTC-USDT", limit=50)
-
-    assert trades == [{"tradeId": "1"}]
-
-
-def test_get_candlesticks() -> None:
-    response = DummyResponse(
-        {"code": "0", "data": [["1", "2", "3", "4", "5", "6", "7"]]}
-    )
-
-    with patch("requests.get", return_value=response) as mock_get:
-        client = OkxClient()
-        candles = client.get_candlesticks("BTC-USDT", bar="1m", limit=2)
-
-    assert candles == [["1", "2", "3", "4", "5", "6", "7"]]
-    mock_get.assert_called_once_with(
-        "https://www.okx.com/api/v5/market/candles",
-        params={"instId": "BTC-USDT", "bar": "1m", "limit": "2"},
-        timeout=client.timeout,
-    )
-
-
-def test_retries_on_request_failure() -> None:
-    good_response = DummyResponse({"code": "0", "data": []})
-    mock_get = MagicMock(side_effect=[requests.RequestException("boom"), good_response])
-
-    with patch("requests.get", mock_get), patch("time.sleep") as mock_sleep:
-        client = OkxClient(max_retries=2, retry_backoff=0.1)
-        result = client.list_instruments()
-
-    assert result == []
-    assert mock_get.call_count == 2
-    mock_sleep.assert_called_once_with(0.1)
-
-
-def test_retries_on_api_error() -> None:
-    error_response = DummyResponse({"code": "500", "msg": "fail"})
-    good_response = DummyResponse({"code": "0", "data": []})
-    mock_get = MagicMock(side_effect=[error_response, good_response])
-
-    with patch("requests.get", mock_get), patch("time.sleep") as mock_sleep:
-        client = OkxClient(max_retries=2, retry_backoff=0.2)
-        result = client.list_instruments()
-
-    assert result == []
-    mock_sleep.assert_called_once_with(0.2)
-
-
-def test_api_error_raised_after_retries() -> None:
-    error_response = DummyResponse({"code": "500", "msg": "fail"})
-
-    with patch("requests.get", return_value=error_response):
-        client = OkxClient(max_retries=1)
-        with pytest.raises(OkxApiError):
-            client.list_instruments()
+    payload: Dict[str, Any]
+    status_code: int = 200
+    headers: Optional[Dict[str, str]] = None
+
+
+class Call(NamedTuple):
+    path: str
+    params: Dict[str, str]
+    timeout: Any
+
+
+OK_EMPTY = Reply({"code": "0", "data": []})
+API_ERROR = Reply({"code": "500", "msg": "fail"})
+
+
+class FakeTransport(BaseAdapter):
+    """Transport adapter that answers by URL path from a table of queued results.
+
+    Requests still go through Session.get, URL/query encoding and raise_for_status;
+    only the network hop is replaced. Each path serves its results in order and
+    keeps serving the last one, so a single reply behaves like a fixed response.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.reset()
+
+    def reset(self) -> None:
+        self.routes: Dict[str, list[Any]] = {}
+        self.calls: list[Call] = []
+
+    def add(self, path: str, *results: Any) -> None:
+        self.routes[path] = list(results)
+
+    def send(self, request: requests.PreparedRequest, timeout: Any = None, **_: Any) -> Any:
+        url = urlsplit(request.url)
+        self.calls.append(Call(url.path, dict(parse_qsl(url.query)), timeout))
+        results = self.routes[url.path]
+        result = results.pop(0) if len(results) > 1 else results[0]
+        if isinstance(result, BaseException):
+            raise result
+        response = requests.Response()
+        response.status_code = result.status_code
+        response.headers.update(result.headers or {})
+        response._content = json.dumps(result.payload).encode()
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture(scope="module")
+def _transport() -> Iterator[FakeTransport]:
+    # Installed once for the module on every Session; each test only resets the table.
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        transport = FakeTransport()
+        monkeypatch.setattr(requests.Session, "get_adapter", lambda self, url: transport)
+        yield transport
+
+
+@pytest.fixture
+def transport(_transport: FakeTransport) -> FakeTransport:
+    _transport.reset()
+    return _transport
+
+
+@pytest.fixture(scope="module")
+def _shared_client() -> Iterator[OkxClient]:
+    client = OkxClient()
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def client(_shared_client: OkxClient) -> OkxClient:
+    # The instruments cache is the client's only state these tests touch.
+    _shared_client.invalidate_instruments()
+    return _shared_client
+
+
+@pytest.mark.parametrize(
+    "name,args,kwargs,path,params,data,expected",
+    [
+        (
+            "list_instruments",
+            ("SPOT",),
+            {},
+            INSTRUMENTS,
+            {"instType": "SPOT"},
+            [{"instId": "BTC-USDT"}],
+            [{"instId": "BTC-USDT"}],
+        ),
+        (
+            "get_order_book",
+            ("BTC-USDT",),
+            {"depth": 10},
+            "/api/v5/market/books",
+            {"instId": "BTC-USDT", "sz": "10"},
+            [{"bids": [["1", "2"]]}],
+            {"bids": [["1", "2"]]},
+        ),
+        (
+            "get_trades",
+            ("BTC-USDT",),
+            {"limit": 50},
+            "/api/v5/market/trades",
+            {"instId": "BTC-USDT", "limit": "50"},
+            [{"tradeId": "1"}],
+            [{"tradeId": "1"}],
+        ),
+        (
+            "get_candlesticks",
+            ("BTC-USDT",),
+            {"bar": "1m", "limit": 2},
+            "/api/v5/market/candles",
+            {"instId": "BTC-USDT", "bar": "1m", "limit": "2"},
+            [["1", "2", "3", "4", "5", "6", "7"]],
+            [["1", "2", "3", "4", "5", "6", "7"]],
+        ),
+    ],
+)
+def test_get_endpoints(
+    transport: FakeTransport,
+    client: OkxClient,
+    name: str,
+    args: tuple[Any, ...],
+    kwargs: dict[str, Any],
+    path: str,
+    params: dict[str, str],
+    data: list[Any],
+    expected: Any,
+) -> None:
+    transport.add(path, Reply({"code": "0", "data": data}))
+
+    result = getattr(client, name)(*args, **kwargs)
+
+    assert result == expected
+    assert transport.calls == [Call(path, params, client.timeout)]
+
+
+def test_list_instruments_is_cached_until_invalidated(
+    transport: FakeTransport, client: OkxClient
+) -> None:
+    transport.add(INSTRUMENTS, Reply({"code": "0", "data": [{"instId": "BTC-USDT"}]}))
+
+    client.list_instruments("SPOT")
+    client.list_instruments("SPOT")
+    assert len(transport.calls) == 1
+
+    client.invalidate_instruments()
+    client.list_instruments("SPOT")
+
+    assert len(transport.calls) == 2
+
+
+@pytest.mark.parametrize(
+    "results,max_retries,retry_backoff,expected_error,expected_sleeps",
+    [
+        ([requests.ConnectionError("boom"), OK_EMPTY], 2, 0.1, None, [0.1]),
+        ([API_ERROR, OK_EMPTY], 2, 0.2, None, [0.2]),
+        ([API_ERROR], 1, 0.5, OkxApiError, []),
+    ],
+    ids=["request-failure", "api-error", "api-error-exhausted"],
+)
+def test_retry_scenarios(
+    transport: FakeTransport,
+    results: list[Any],
+    max_retries: int,
+    retry_backoff: float,
+    expected_error: type[Exception] | None,
+    expected_sleeps: list[float],
+) -> None:
+    transport.add(INSTRUMENTS, *results)
+    sleeps: list[float] = []
+    client = OkxClient(max_retries=max_retries, retry_backoff=retry_backoff, sleep=sleeps.append)
+
+    # Caught inline so both outcomes share one flow through the retry loop.
+    try:
+        outcome: Any = client.list_instruments()
+    except OkxApiError as exc:
+        outcome = exc
+
+    if expected_error is None:
+        assert outcome == []
+    else:
+        assert isinstance(outcome, expected_error)
+    assert len(transport.calls) == len(results)
+    assert sleeps == expected_sleeps
+
+
+def test_rate_limited_retry_waits_for_retry_after(transport: FakeTransport) -> None:
+    limited = Reply({}, status_code=429, headers={"Retry-After": "2"})
+    transport.add(INSTRUMENTS, limited, OK_EMPTY)
+
+    sleeps: list[float] = []
+    client = OkxClient(max_retries=2, retry_backoff=0.1, sleep=sleeps.append)
+    assert client.list_instruments() == []
+
+    assert sleeps == [2.0]
+
+
+def test_client_errors_are_not_retried(transport: FakeTransport) -> None:
+    transport.add(INSTRUMENTS, Reply({}, status_code=404))
+
+    sleeps: list[float] = []
+    client = OkxClient(max_retries=3, sleep=sleeps.append)
+    with pytest.raises(requests.HTTPError):
+        client.list_instruments()
+
+    assert len(transport.calls) == 1
+    assert sleeps == []
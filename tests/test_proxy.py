@@ -1,14 +1,14 @@
 from __future__ import annotations
 
-import sys
-from pathlib import Path
+from types import MappingProxyType
 
 import pytest
 
-ROOT = Path(__file__).resolve().parents[1]
-sys.path.insert(0, str(ROOT / "src"))
-
-from tauto.proxy import ProxyConfig, as_requests_proxies, load_proxy_config  # noqa: E402
+from tauto.proxy import (
+    ProxyConfig,
+    as_requests_proxies,
+    load_proxy_config,
+)
 
 
 def test_load_proxy_config_from_settings() -> None:
@@ -64,17 +64,18 @@ def test_as_requests_proxies() -> None:
     assert as_requests_proxies(config) == {"http": "http://proxy.local:8080"}
 
 
-@pytest.mark.parametrize(
-    "value, expected",
-    [
-        ("host1, host2", ("host1", "host2")),
-        (["host1", "host2"], ("host1", "host2")),
-        ("", tuple()),
-    ],
+_NO_PROXY_CASES: tuple[tuple[object, tuple[str, ...]], ...] = (
+    ("host1, host2", ("host1", "host2")),
+    (["host1", "host2"], ("host1", "host2")),
+    ("", ()),
 )
-def test_no_proxy_normalization(value, expected) -> None:
-    env = {"HTTP_PROXY": "http://env.proxy:8080", "NO_PROXY": ""}
+_ENV_WITH_EMPTY_NO_PROXY = MappingProxyType(
+    {"HTTP_PROXY": "http://env.proxy:8080", "NO_PROXY": ""}
+)
+
 
-    config = load_proxy_config({"no_proxy": value}, env=env)
+@pytest.mark.parametrize("value, expected", _NO_PROXY_CASES)
+def test_no_proxy_normalization(value, expected) -> None:
+    config = load_proxy_config({"no_proxy": value}, env=_ENV_WITH_EMPTY_NO_PROXY)
 
     assert config.no_proxy == expected
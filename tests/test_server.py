@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import time
+from types import SimpleNamespace
+from typing import Any, Iterator
+
+import orjson
+import pytest
+
+pytest.importorskip("httpx")  # fastapi.testclient runs on httpx
+
+from fastapi.testclient import TestClient
+
+from tauto import server
+from tauto.storage import CandleStick, SqliteCandleStore
+
+MINUTE_MS = 60 * 1000
+
+
+def _candle(ts: int, source: str = "okx", inst_id: str = "BTC-USDT") -> CandleStick:
+    return CandleStick(source, inst_id, "1m", ts, 1.0, 2.0, 0.5, 1.5, 10.0, 1.0, 1.0, True)
+
+
+class FakeClient:
+    """Upstream client stand-in that records every call and returns canned data."""
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, tuple[Any, ...], dict[str, Any]]] = []
+        self.ticker: Any = {}
+        self.klines: Any = []
+
+    def _record(self, name: str, *args: Any, **kwargs: Any) -> None:
+        self.calls.append((name, args, kwargs))
+
+    def get_ticker(self, *args: Any, **kwargs: Any) -> Any:
+        self._record("get_ticker", *args, **kwargs)
+        if isinstance(self.ticker, BaseException):
+            raise self.ticker
+        return self.ticker
+
+    def get_klines(self, *args: Any, **kwargs: Any) -> list[list[Any]]:
+        self._record("get_klines", *args, **kwargs)
+        if callable(self.klines):
+            return self.klines(**kwargs)
+        return self.klines
+
+    def close(self) -> None:
+        pass
+
+
+class CountingLimiter:
+    def __init__(self) -> None:
+        self.acquired = 0
+
+    def acquire(self) -> None:
+        self.acquired += 1
+
+
+@pytest.fixture
+def api(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[SimpleNamespace]:
+    store = SqliteCandleStore(str(tmp_path / "server.db"), read_pool_size=2)
+    okx, binance = FakeClient(), FakeClient()
+    monkeypatch.setattr(server, "store", store)
+    monkeypatch.setattr(server, "okx_client", okx)
+    monkeypatch.setattr(server, "binance_client", binance)
+    limiter = CountingLimiter()
+    monkeypatch.setattr(server, "binance_limiter", limiter)
+    server._TICKER_CACHE.clear()
+    server._LAST_BINANCE_REFRESH.clear()
+    with TestClient(server.app) as client:
+        yield SimpleNamespace(
+            client=client, store=store, okx=okx, binance=binance, limiter=limiter
+        )
+
+
+def test_all_data_streams_valid_json_under_concurrent_requests(api: SimpleNamespace) -> None:
+    # Several fetchmany batches per response, so each body is produced over many
+    # threadpool steps that may land on different worker threads.
+    api.store.upsert_candles([_candle(ts * MINUTE_MS) for ts in range(1, 2001)])
+
+    def fetch(_: int) -> dict:
+        response = api.client.get(
+            "/api/candles", params={"inst_id": "BTC-USDT", "bar": "1m", "all_data": "true"}
+        )
+        assert response.status_code == 200
+        return orjson.loads(response.content)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        bodies = list(executor.map(fetch, range(16)))
+
+    for body in bodies:
+        assert body["count"] == 2000
+        assert [row["timestamp"] for row in body["data"]] == [
+            ts * MINUTE_MS for ts in range(1, 2001)
+        ]
+
+
+def test_all_data_payload_keeps_the_buffered_response_shape(api: SimpleNamespace) -> None:
+    api.store.upsert_candles([_candle(ts * MINUTE_MS) for ts in range(1, 51)])
+
+    response = api.client.get(
+        "/api/candles",
+        params={"inst_id": "BTC-USDT", "bar": "1m", "all_data": "true"},
+        headers={"Accept-Encoding": "gzip"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.headers["content-encoding"] == "gzip"
+    body = orjson.loads(response.content)
+    assert list(body) == ["instId", "bar", "source", "data", "count"]
+    assert (body["instId"], body["bar"], body["source"], body["count"]) == (
+        "BTC-USDT",
+        "1m",
+        "okx",
+        50,
+    )
+    assert body["data"][0] == {
+        "timestamp": MINUTE_MS,
+        "open": 1.0,
+        "high": 2.0,
+        "low": 0.5,
+        "close": 1.5,
+        "volume": 10.0,
+    }
+
+
+def test_index_answers_a_matching_etag_with_not_modified(api: SimpleNamespace) -> None:
+    first = api.client.get("/")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    again = api.client.get("/", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["etag"] == etag
+    assert api.client.get("/", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def _ticker_calls(client: FakeClient) -> int:
+    return sum(1 for name, _, _ in client.calls if name == "get_ticker")
+
+
+def test_concurrent_ticker_requests_share_one_upstream_call(
+    api: SimpleNamespace, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # With the cache disabled only the single-flight can collapse the requests.
+    monkeypatch.setattr(server, "TICKER_CACHE_TTL_SECONDS", 0.0)
+    okx_get_ticker = api.okx.get_ticker
+
+    def slow_get_ticker(*args: Any, **kwargs: Any) -> Any:
+        time.sleep(0.3)  # keep the leader in flight while the others arrive
+        return okx_get_ticker(*args, **kwargs)
+
+    api.okx.get_ticker = slow_get_ticker
+    api.okx.ticker = {"last": "100", "ts": "1"}
+
+    def fetch(_: int) -> dict:
+        response = api.client.get("/api/ticker", params={"inst_id": "BTC-USDT"})
+        assert response.status_code == 200
+        return response.json()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        bodies = list(executor.map(fetch, range(8)))
+
+    assert _ticker_calls(api.okx) == 1
+    assert all(body["last"] == "100" for body in bodies)
+
+
+def test_ticker_cache_expires_and_never_stores_errors(api: SimpleNamespace) -> None:
+    params = {"inst_id": "BTC-USDT"}
+    api.okx.ticker = RuntimeError("upstream down")
+    assert api.client.get("/api/ticker", params=params).status_code == 502
+    assert not server._TICKER_CACHE
+
+    # The failure was not cached, so the next request goes upstream again.
+    api.okx.ticker = {"last": "100", "ts": "1"}
+    assert api.client.get("/api/ticker", params=params).json()["last"] == "100"
+    api.okx.ticker = {"last": "101", "ts": "2"}
+    assert api.client.get("/api/ticker", params=params).json()["last"] == "100"
+    assert _ticker_calls(api.okx) == 2
+
+    # Age the entry past the TTL instead of sleeping through it.
+    fetched_at, payload = server._TICKER_CACHE[("okx", "BTC-USDT")]
+    server._TICKER_CACHE[("okx", "BTC-USDT")] = (
+        fetched_at - server.TICKER_CACHE_TTL_SECONDS,
+        payload,
+    )
+    assert api.client.get("/api/ticker", params=params).json()["last"] == "101"
+    assert _ticker_calls(api.okx) == 3
+
+
+def _kline(ts: int) -> list[Any]:
+    return [ts, "1", "2", "0.5", "1.5", "10", ts + MINUTE_MS - 1, "15"]
+
+
+def test_binance_history_backfill_stops_submitting_after_an_empty_window(
+    api: SimpleNamespace,
+) -> None:
+    window_ms = server.BINANCE_KLINES_MAX_LIMIT * MINUTE_MS
+    listed_at = server.time.time_ns() // 1_000_000 - 5 * window_ms // 2
+
+    def klines(end_time: int, **_: Any) -> list[list[Any]]:
+        # Three windows of history, then nothing before the listing date.
+        if end_time < listed_at:
+            return []
+        return [_kline(end_time - end_time % MINUTE_MS)]
+
+    api.binance.klines = klines
+    response = api.client.get(
+        "/api/candles",
+        params={"inst_id": "BTCUSDT", "bar": "1m", "source": "binance", "all_data": "true"},
+    )
+
+    assert response.status_code == 200
+    assert orjson.loads(response.content)["count"] == 3
+    # About 130 windows cover 90 days of 1m bars; only the first few are requested.
+    requests_made = len(api.binance.calls)
+    assert requests_made <= 4 + server.BINANCE_BACKFILL_CONCURRENCY
+    assert api.limiter.acquired == requests_made
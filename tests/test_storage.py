@@ -0,0 +1,477 @@
+from __future__ import annotations
+
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from tauto.storage import (
+    CandleColumns,
+    CandleStick,
+    SqliteCandleStore,
+    _candle_range_sql,
+    compute_retention_cutoff,
+    open_candle_store,
+    subtract_months,
+)
+
+
+def _candle(
+    ts: int, close: float = 1.0, confirm: bool = True, bar: str = "1m", source: str = "okx"
+) -> CandleStick:
+    return CandleStick(
+        source=source,
+        inst_id="BTC-USDT",
+        bar=bar,
+        ts=ts,
+        open=1.0,
+        high=2.0,
+        low=0.5,
+        close=close,
+        volume=10.0,
+        volume_ccy=20.0,
+        volume_quote=30.0,
+        confirm=confirm,
+    )
+
+
+def _store(tmp_path: Path) -> SqliteCandleStore:
+    store = SqliteCandleStore(str(tmp_path / "candles.db"))
+    store.initialize()
+    return store
+
+
+def test_upsert_and_fetch_candles(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    store.upsert_candles([_candle(180_000), _candle(60_000), _candle(120_000)])
+
+    candles = store.fetch_candles("okx", "BTC-USDT", "1m", limit=2)
+
+    assert [candle.ts for candle in candles] == [120_000, 180_000]
+    assert store.latest_timestamp("okx", "BTC-USDT", "1m") == 180_000
+    assert store.fetch_existing_timestamps("okx", "BTC-USDT", "1m", 0, 120_000) == [
+        60_000,
+        120_000,
+    ]
+
+
+def test_upsert_updates_existing_candle(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    store.upsert_candles([_candle(60_000, close=1.0, confirm=False)])
+    store.upsert_candles([_candle(60_000, close=1.5, confirm=True)])
+
+    candles = store.fetch_candles("okx", "BTC-USDT", "1m", limit=None)
+
+    assert candles == [_candle(60_000, close=1.5, confirm=True)]
+
+
+def test_delete_older_than(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    store.upsert_candles([_candle(60_000), _candle(120_000), _candle(180_000)])
+
+    deleted = store.delete_older_than(120_000)
+
+    assert deleted == 1
+    assert store.fetch_existing_timestamps("okx", "BTC-USDT", "1m", 0, 200_000) == [
+        120_000,
+        180_000,
+    ]
+
+
+def test_candle_columns_round_trip_through_store(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    columns = CandleColumns("okx", "BTC-USDT", "1m")
+    columns.extend([_candle(60_000), _candle(120_000, close=3.0, confirm=False)])
+
+    store.upsert_candles(columns)
+
+    assert len(columns) == 2
+    assert columns[1] == _candle(120_000, close=3.0, confirm=False)
+    assert store.fetch_candles("okx", "BTC-USDT", "1m", limit=None) == columns.to_candles()
+
+
+def test_complete_days_are_forgotten_with_their_candles(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    store.mark_days_complete("okx", "BTC-USDT", "1m", [0, 86_400_000])
+
+    store.delete_older_than(86_400_000)
+
+    assert store.fetch_complete_days("okx", "BTC-USDT", "1m", 0) == {86_400_000}
+
+
+def test_initialize_switches_database_to_wal(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+
+    with store._connection() as connection:
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert connection.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+
+def test_connection_cache_and_mmap_sizes_are_configurable(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "tuned.db"), cache_size_kib=1024, mmap_size=0)
+    store.initialize()
+
+    with store._connection() as connection:
+        assert connection.execute("PRAGMA cache_size").fetchone()[0] == -1024
+        assert connection.execute("PRAGMA mmap_size").fetchone()[0] == 0
+        assert connection.execute("PRAGMA page_size").fetchone()[0] == 8192
+
+
+def test_existing_timestamp_scan_is_answered_from_the_primary_key(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+
+    with store._connection() as connection:
+        plan = connection.execute(
+            """
+            EXPLAIN QUERY PLAN
+            SELECT ts FROM candles
+            WHERE source = ? AND inst_id = ? AND bar = ? AND ts BETWEEN ? AND ?
+            ORDER BY ts ASC
+            """,
+            ("okx", "BTC-USDT", "1m", 0, 1),
+        ).fetchall()
+
+    detail = " ".join(row[-1] for row in plan)
+    assert "COVERING INDEX sqlite_autoindex_candles_1" in detail
+    assert "TEMP B-TREE" not in detail
+
+
+def test_newest_candles_are_read_backwards_along_the_primary_key(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    query = _candle_range_sql("ts, close", False, True, True)
+
+    with store._connection() as connection:
+        plan = connection.execute(
+            f"EXPLAIN QUERY PLAN {query}", ("okx", "BTC-USDT", "1m", 1, 300)
+        ).fetchall()
+
+    details = [row[-1] for row in plan]
+    assert any("USING INDEX sqlite_autoindex_candles_1" in detail for detail in details)
+    # Only the outer ascending re-sort of the LIMITed rows needs a temporary B-tree.
+    assert sum("TEMP B-TREE" in detail for detail in details) == 1
+
+
+def test_latest_timestamp_is_cached_and_advanced_by_upserts(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    store.upsert_candles([_candle(60_000)])
+    assert store.latest_timestamp("okx", "BTC-USDT", "1m") == 60_000
+
+    store.upsert_candles([_candle(180_000), _candle(120_000)])
+    with patch.object(store, "_connection", side_effect=AssertionError("query not expected")):
+        assert store.latest_timestamp("okx", "BTC-USDT", "1m") == 180_000
+
+    store.delete_older_than(200_000)
+    assert store.latest_timestamp("okx", "BTC-USDT", "1m") is None
+
+
+def test_fetch_candle_columns_matches_fetch_candles(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    store.upsert_candles([_candle(180_000, close=3.0), _candle(60_000), _candle(120_000, confirm=False)])
+
+    columns = store.fetch_candle_columns("okx", "BTC-USDT", "1m", limit=2)
+
+    assert list(columns.ts) == [120_000, 180_000]
+    assert columns.to_candles() == store.fetch_candles("okx", "BTC-USDT", "1m", limit=2)
+    assert len(store.fetch_candle_columns("okx", "ETH-USDT", "1m")) == 0
+
+
+def test_iter_candle_batches_yields_oldest_first_in_batches(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    store.upsert_candles([_candle(ts) for ts in (180_000, 60_000, 120_000)])
+
+    batches = list(store.iter_candle_batches("okx", "BTC-USDT", "1m", batch_size=2))
+
+    assert [[row[0] for row in batch] for batch in batches] == [[60_000, 120_000], [180_000]]
+    assert list(store.iter_candle_batches("okx", "ETH-USDT", "1m")) == []
+
+
+def test_iter_candle_batches_can_be_resumed_on_other_threads(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    store.upsert_candles([_candle(ts) for ts in (60_000, 120_000, 180_000)])
+    batches = store.iter_candle_batches("okx", "BTC-USDT", "1m", batch_size=1)
+
+    # Like StreamingResponse: every step runs on a fresh worker thread.
+    steps = []
+    for _ in range(4):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            steps.append(executor.submit(next, batches, None).result())
+
+    assert [batch and batch[0][0] for batch in steps] == [60_000, 120_000, 180_000, None]
+
+
+def test_store_reuses_one_connection_until_closed(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    store.upsert_candles([_candle(60_000)])
+
+    with patch.object(store, "_connect", side_effect=AssertionError("reconnect not expected")):
+        assert [c.ts for c in store.fetch_candles("okx", "BTC-USDT", "1m")] == [60_000]
+
+    store.close()
+    assert [c.ts for c in store.fetch_candles("okx", "BTC-USDT", "1m")] == [60_000]
+
+
+def test_missing_timestamps_are_computed_in_sql(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    store.upsert_candles([_candle(60_000), _candle(180_000)])
+
+    expected = range(0, 240_001, 60_000)
+    assert store.missing_timestamps("okx", "BTC-USDT", "1m", expected) == [0, 120_000, 240_000]
+    assert store.missing_timestamps("okx", "ETH-USDT", "1m", [60_000]) == [60_000]
+    assert store.missing_timestamps("okx", "BTC-USDT", "1m", []) == []
+
+
+def test_delete_older_than_removes_rows_in_bounded_chunks(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "chunked.db"), delete_batch_size=2)
+    store.initialize()
+    store.upsert_candles([_candle(ts) for ts in range(60_000, 360_001, 60_000)])
+
+    assert store.delete_older_than(300_000) == 4
+    assert store.fetch_existing_timestamps("okx", "BTC-USDT", "1m", 0, 400_000) == [
+        300_000,
+        360_000,
+    ]
+
+
+def test_delete_older_than_purges_every_source_in_chunks(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "chunked.db"), delete_batch_size=2)
+    store.initialize()
+    for source in ("binance", "okx"):
+        store.upsert_candles(
+            [_candle(ts, source=source) for ts in range(60_000, 360_001, 60_000)]
+        )
+
+    assert store.delete_older_than(300_000) == 8
+    for source in ("binance", "okx"):
+        assert store.fetch_existing_timestamps(source, "BTC-USDT", "1m", 0, 400_000) == [
+            300_000,
+            360_000,
+        ]
+
+
+def test_orderbook_snapshots_round_trip_including_legacy_text_rows(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    store.upsert_orderbook_snapshot("BTC-USDT", 1_000, [["100.5", "2"]], [["101", "1"]], depth=1)
+    with store._connection() as connection:
+        connection.execute(
+            "INSERT INTO orderbook_snapshots VALUES (?, ?, ?, ?, ?, ?)",
+            ("BTC-USDT", 2, 2_000, 1, '[["99","3"]]', '[["102","4"]]'),
+        )
+
+    snapshots = store.fetch_orderbook_snapshots("BTC-USDT")
+
+    assert snapshots == [
+        {"ts": 1_000, "bids": [["100.5", "2"]], "asks": [["101", "1"]]},
+        {"ts": 2_000, "bids": [["99", "3"]], "asks": [["102", "4"]]},
+    ]
+
+
+def test_orderbook_snapshots_can_be_upserted_in_one_batch(tmp_path: Path) -> None:
+    store = _store(tmp_path)
+    store.upsert_orderbook_snapshots(
+        [
+            ("BTC-USDT", 1_000, [["1", "1"]], [["2", "1"]], 1),
+            ("BTC-USDT", 1_500, [["1", "5"]], [["2", "5"]], 1),
+            ("BTC-USDT", 2_000, [["3", "1"]], [["4", "1"]], None),
+        ]
+    )
+
+    # Snapshots within the same second collapse onto the latest one.
+    assert [(row["ts"], row["bids"]) for row in store.fetch_orderbook_snapshots("BTC-USDT")] == [
+        (1_500, [["1", "5"]]),
+        (2_000, [["3", "1"]]),
+    ]
+
+
+def test_subtract_months_clamps_to_month_end_across_years() -> None:
+    assert subtract_months(datetime(2024, 3, 31), 1) == datetime(2024, 2, 29)
+    assert subtract_months(datetime(2024, 1, 15), 1) == datetime(2023, 12, 15)
+    assert subtract_months(datetime(2024, 1, 31), 13) == datetime(2022, 12, 31)
+
+
+def test_retention_cutoff_from_clock_matches_explicit_now() -> None:
+    now = datetime(2024, 3, 31, 13, 45, 6, 789000, tzinfo=timezone.utc)
+    now_ns = int(now.timestamp()) * 1_000_000_000 + 789_000_000
+    with patch("tauto.storage.time.time_ns", return_value=now_ns):
+        cutoff = compute_retention_cutoff(1)
+    assert cutoff == compute_retention_cutoff(1, now=now)
+    expected = datetime(2024, 2, 29, 13, 45, 6, 789000, tzinfo=timezone.utc)
+    assert cutoff == int(expected.timestamp() * 1000)
+
+
+def test_sharded_store_routes_series_to_per_source_bar_files(tmp_path: Path) -> None:
+    store = open_candle_store(str(tmp_path / "candles_{source}_{bar}.db"))
+    store.initialize()
+    store.upsert_candles([_candle(60_000), _candle(120_000, bar="5m"), _candle(180_000)])
+    store.upsert_orderbook_snapshot("BTC-USDT", 1_000, [["1", "1"]], [["2", "1"]])
+
+    assert sorted(path.name for path in tmp_path.glob("*.db")) == [
+        "candles_okx_1m.db",
+        "candles_okx_5m.db",
+        "orderbook.db",
+    ]
+    assert [c.ts for c in store.fetch_candles("okx", "BTC-USDT", "1m")] == [60_000, 180_000]
+    assert store.latest_timestamp("okx", "BTC-USDT", "5m") == 120_000
+    assert len(store.fetch_orderbook_snapshots("BTC-USDT")) == 1
+    store.close()
+
+    reopened = open_candle_store(str(tmp_path / "candles_{source}_{bar}.db"))
+    reopened.initialize()
+    assert reopened.delete_older_than(200_000) == 3
+
+
+def test_sharded_store_rejects_placeholders_in_directories(tmp_path: Path) -> None:
+    with pytest.raises(ValueError, match="file name"):
+        open_candle_store(str(tmp_path / "{source}" / "candles_{bar}.db"))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_sharded_store_names_month_bars_apart_and_reads_create_no_files(
+    tmp_path: Path,
+) -> None:
+    template = str(tmp_path / "candles_{source}_{bar}.db")
+    store = open_candle_store(template)
+    store.initialize()
+
+    assert store.fetch_candles("okx", "BTC-USDT", "1M") == []
+    assert store.latest_timestamp("okx", "BTC-USDT", "1M") is None
+    assert store.missing_timestamps("okx", "BTC-USDT", "1M", [2, 1, 2]) == [1, 2]
+    assert list(store.iter_candle_batches("okx", "BTC-USDT", "1M")) == []
+    store.mark_days_complete("okx", "BTC-USDT", "1M", [])
+    assert [path.name for path in tmp_path.glob("*.db")] == ["orderbook.db"]
+
+    store.upsert_candles([_candle(60_000), _candle(120_000, bar="1M")])
+    assert sorted(path.name for path in tmp_path.glob("candles_*.db")) == [
+        "candles_okx_1Mo.db",
+        "candles_okx_1m.db",
+    ]
+
+    # A second store (e.g. the server next to the fetcher) sees shards created later.
+    reader = open_candle_store(template)
+    reader.initialize()
+    assert [c.ts for c in reader.fetch_candles("okx", "BTC-USDT", "1M")] == [120_000]
+    store.upsert_candles([_candle(180_000, bar="5m")])
+    assert reader.latest_timestamp("okx", "BTC-USDT", "5m") == 180_000
+    assert reader.delete_older_than(200_000) == 3
+    store.close()
+    reader.close()
+
+
+def test_background_writes_are_committed_before_reads(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "queued.db"), background_writes=True)
+    store.initialize()
+    for ts in range(60_000, 600_001, 60_000):
+        store.upsert_candles([_candle(ts)])
+    store.upsert_orderbook_snapshot("BTC-USDT", 1_000, [["1", "1"]], [["2", "1"]])
+
+    assert len(store.fetch_candles("okx", "BTC-USDT", "1m", limit=None)) == 10
+    assert store.latest_timestamp("okx", "BTC-USDT", "1m") == 600_000
+    assert len(store.fetch_orderbook_snapshots("BTC-USDT")) == 1
+    store.close()
+
+
+def test_background_write_failure_is_raised_on_flush(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "queued.db"), background_writes=True)
+    store.initialize()
+    store.upsert_candles([_candle(60_000, close=None)])  # violates NOT NULL
+
+    with pytest.raises(sqlite3.IntegrityError):
+        store.flush()
+    store.flush()
+    assert store.fetch_candles("okx", "BTC-USDT", "1m") == []
+    store.close()
+
+
+def test_read_pool_reads_committed_rows_while_a_write_is_open(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "pooled.db"), read_pool_size=2)
+    store.initialize()
+    store.upsert_candles([_candle(60_000)])
+
+    # The shared connection (and its lock) stays busy; pooled readers do not need it.
+    with store._connection() as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute("DELETE FROM candles")
+        assert [c.ts for c in store.fetch_candles("okx", "BTC-USDT", "1m")] == [60_000]
+        assert store.missing_timestamps("okx", "BTC-USDT", "1m", [60_000, 120_000]) == [
+            120_000
+        ]
+
+    assert store.fetch_candles("okx", "BTC-USDT", "1m") == []
+    with store._read_connection() as reader:
+        with pytest.raises(sqlite3.OperationalError):
+            reader.execute("DELETE FROM candles")
+    assert store._read_pool_open == 1
+    store.close()
+
+
+def test_background_writes_copy_rows_before_the_caller_reuses_them(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "queued.db"), background_writes=True)
+    store.initialize()
+    batch = [_candle(60_000), _candle(120_000)]
+    columns = CandleColumns("okx", "BTC-USDT", "5m")
+    columns.extend([_candle(300_000, bar="5m")])
+
+    # Hold the writer back so the queued jobs are still pending while inputs change.
+    with store._lock:
+        store.upsert_candles(batch)
+        store.upsert_candles(columns)
+        batch.clear()
+        columns.ts[0] = -1
+
+    store.flush()
+    assert [c.ts for c in store.fetch_candles("okx", "BTC-USDT", "1m")] == [60_000, 120_000]
+    assert [c.ts for c in store.fetch_candles("okx", "BTC-USDT", "5m")] == [300_000]
+    store.close()
+
+
+def test_background_write_failure_is_not_raised_by_reads(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "queued.db"), background_writes=True)
+    store.initialize()
+    store.upsert_candles([_candle(60_000, close=None)])  # violates NOT NULL
+
+    assert store.fetch_candles("okx", "BTC-USDT", "1m") == []
+    assert store.latest_timestamp("okx", "BTC-USDT", "1m") is None
+    store.upsert_candles([_candle(120_000)])
+    store.upsert_candles([_candle(180_000, close=None)])
+    with pytest.raises(sqlite3.IntegrityError):
+        store.close()
+    assert [c.ts for c in store.fetch_candles("okx", "BTC-USDT", "1m")] == [120_000]
+
+
+def test_background_write_after_a_failure_is_still_committed(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "queued.db"), background_writes=True)
+    store.initialize()
+    store._write("INSERT INTO nosuch VALUES (?)", [(1,)])
+    store._wait_for_writes()
+
+    # The earlier failure belongs to the writer; this caller's rows are queued anyway.
+    store.upsert_candles([_candle(60_000)])
+    with pytest.raises(sqlite3.OperationalError, match="nosuch"):
+        store.flush()
+    store.flush()
+    assert [c.ts for c in store.fetch_candles("okx", "BTC-USDT", "1m")] == [60_000]
+    store.close()
+
+
+def test_background_callback_failure_does_not_recommit_the_batch(tmp_path: Path) -> None:
+    store = SqliteCandleStore(str(tmp_path / "queued.db"), background_writes=True)
+    store.initialize()
+    callbacks: list[str] = []
+
+    def failing() -> None:
+        callbacks.append("failing")
+        raise RuntimeError("callback failed")
+
+    # The writer takes the first job and blocks on the lock; the next two queue up
+    # behind it and are folded into one batch once the lock is released.
+    with store._lock:
+        store._write("DELETE FROM candles WHERE ts = ?", [(-1,)])
+        store._write("DELETE FROM candles WHERE ts = ?", [(0,)], failing)
+        store._write("DELETE FROM candles WHERE ts = ?", [(1,)], lambda: callbacks.append("ok"))
+
+    with pytest.raises(RuntimeError, match="callback failed"):
+        store.flush()
+    assert callbacks == ["failing", "ok"]
+    store.close()